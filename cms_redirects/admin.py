@@ -1,24 +1,81 @@
 """Admin setup for redirects."""
 from django.contrib import admin
+from django.db import connections
+from django.db.models.query import QuerySet
+from django.utils.translation import get_language, ugettext_lazy as _
 from cms_redirects.models import CMSRedirect
 
 
+# Below this many rows counting them is cheap enough to do exactly.
+ESTIMATED_COUNT_THRESHOLD = 10000
+
+
+class EstimatedCountQuerySet(QuerySet):
+    """QuerySet estimating the number of redirects on PostgreSQL.
+
+    Counting millions of rows takes seconds on every changelist page. When
+    no filter or search applies, the planner's row estimate is used
+    instead, which is plenty for pagination.
+    """
+    def count(self):
+        """Returns the estimated number of rows in the table if it is big."""
+        connection = connections[self.db]
+        if self.query.where or connection.vendor != 'postgresql':
+            return super(EstimatedCountQuerySet, self).count()
+        cursor = connection.cursor()
+        cursor.execute(
+            "SELECT reltuples FROM pg_class WHERE relname = %s",
+            [self.model._meta.db_table])
+        row = cursor.fetchone()
+        if row is None or row[0] < ESTIMATED_COUNT_THRESHOLD:
+            return super(EstimatedCountQuerySet, self).count()
+        return int(row[0])
+
+
 class CMSRedirectAdmin(admin.ModelAdmin):
     """Admin configuration for redirects"""
     list_display = (
         'old_path',
         'new_path',
-        'page',
+        'page_title',
         'page_site',
         'site',
         'actual_response_code'
     )
     list_filter = ('site',)
-    search_fields = ('old_path', 'new_path', 'page__title_set__title')
+    # Prefix searches can use the indexes added by the
+    # add_cmsredirect_search_indexes migration, unlike searching anywhere
+    # in a path or joining the page titles.
+    search_fields = ('^old_path', '^new_path')
+    # Newest first walks the primary key index, old_path has no index to
+    # sort with.
+    ordering = ('-pk',)
     radio_fields = {'site': admin.VERTICAL}
     fieldsets = [
         ('Source', {'fields': ('site', 'old_path')}),
-        ('Destination', {'fields': ('new_path', 'page', 'response_code')})
+        ('Destination', {'fields': (
+            'new_path', 'page', 'response_code', 'query_handling')}),
+        ('Schedule', {'fields': ('valid_from', 'valid_until')})
     ]
 
+    def queryset(self, request):
+        """Fetch the page, site and page titles of every redirect at once."""
+        queryset = super(CMSRedirectAdmin, self).queryset(request)
+        return queryset._clone(klass=EstimatedCountQuerySet).select_related(
+            'site', 'page', 'page__site').prefetch_related('page__title_set')
+
+    def page_title(self, redirect):
+        """Title of the destination page, from the prefetched titles."""
+        if not redirect.page:
+            return u''
+        titles = list(redirect.page.title_set.all())
+        for title in titles:
+            if title.language == get_language():
+                return title.title
+        if titles:
+            return titles[0].title
+        return u''
+    page_title.short_description = _('page')
+    page_title.admin_order_field = 'page'
+
 admin.site.register(CMSRedirect, CMSRedirectAdmin)
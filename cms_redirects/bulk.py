@@ -0,0 +1,132 @@
+"""Loading many redirects at once."""
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from cms_redirects.models import CMSRedirect, next_revision
+from cms_redirects.utils import mark_recent_write, path_hash
+
+
+def chunks(iterable, size):
+    """Yield lists of up to ``size`` items of an iterable."""
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def load_redirects(site, redirects, chunk_size=1000):
+    """Create the redirects of a site that do not exist yet.
+
+    ``redirects`` is an iterable of unsaved ``CMSRedirect`` instances, read
+    ``chunk_size`` at a time. Redirects from a path that already has one,
+    in the database or earlier on, are skipped. Every chunk costs one query
+    for the existing paths and one insert, all in one transaction, which
+    takes one revision for every redirect created.
+
+    Returns the number of redirects created and skipped.
+    """
+    created = skipped = 0
+    seen = set()
+    with transaction.commit_on_success():
+        revision = next_revision(CMSRedirect.objects.db)
+        for chunk in chunks(redirects, chunk_size):
+            for redirect in chunk:
+                redirect.site = site
+                redirect.old_path_hash = path_hash(redirect.old_path)
+                redirect.revision = revision or 0
+            seen.update(CMSRedirect.objects.filter(
+                site=site,
+                old_path_hash__in=[r.old_path_hash for r in chunk],
+            ).values_list('old_path_hash', flat=True))
+            new = []
+            for redirect in chunk:
+                if redirect.old_path_hash in seen:
+                    skipped += 1
+                else:
+                    seen.add(redirect.old_path_hash)
+                    new.append(redirect)
+            CMSRedirect.objects.bulk_create(new)
+            created += len(new)
+    if created:
+        mark_recent_write(site.pk)
+    return created, skipped
+
+
+def upsert_redirects(site, redirects, chunk_size=500):
+    """Create or update many redirects of a site at once.
+
+    ``redirects`` is a list of dicts of ``CMSRedirect`` field values by
+    name, keyed on ``old_path``; later ones win over earlier ones from the
+    same path. Existing redirects are found with a query per
+    ``chunk_size`` paths and new ones are bulk created. Changed ones are
+    deleted and bulk created again with the same ids, ``chunk_size`` at
+    a time, however different their new values. It all happens in one
+    transaction, which takes one revision for every redirect written.
+
+    Raises ``ValidationError``, changing nothing, if any redirect would
+    end before it starts, taking the fields not given from the existing
+    redirect.
+
+    Returns the number of redirects created, updated and unchanged.
+    """
+    values = {}
+    for redirect in redirects:
+        values[path_hash(redirect['old_path'])] = redirect
+    hashes = values.keys()
+    existing = {}
+    created = updated = unchanged = 0
+    with transaction.commit_on_success():
+        revision = next_revision(CMSRedirect.objects.db)
+        for chunk in chunks(hashes, chunk_size):
+            for redirect in CMSRedirect.objects.filter(
+                    site=site, old_path_hash__in=chunk).order_by():
+                existing[redirect.old_path_hash] = redirect
+        new = []
+        changed = []
+        errors = []
+        for old_path_hash in hashes:
+            fields = dict((name, value) for name, value in
+                          values[old_path_hash].iteritems()
+                          if name != 'old_path')
+            redirect = existing.get(old_path_hash)
+            if redirect is None:
+                redirect = CMSRedirect(
+                    site=site, old_path=values[old_path_hash]['old_path'],
+                    old_path_hash=old_path_hash, revision=revision or 0,
+                    **fields)
+                new.append(redirect)
+            elif all(getattr(redirect, name) == value
+                     for name, value in fields.iteritems()):
+                unchanged += 1
+                continue
+            else:
+                for name, value in fields.iteritems():
+                    setattr(redirect, name, value)
+                redirect.revision = revision or 0
+                changed.append(redirect)
+            try:
+                redirect.clean_schedule()
+            except ValidationError, error:
+                errors.extend('%s: %s' % (redirect.old_path, message)
+                              for message in error.messages)
+        if errors:
+            raise ValidationError(errors)
+        for chunk in chunks(new, chunk_size):
+            CMSRedirect.objects.bulk_create(chunk)
+        created = len(new)
+        for chunk in chunks(changed, chunk_size):
+            # The rows are inserted again straight away, so the raw delete
+            # leaves no tombstones. On PostgreSQL the trigger still does,
+            # and syncs apply those before the rows written with them.
+            CMSRedirect.objects.filter(
+                pk__in=[redirect.pk for redirect in chunk]
+            )._raw_delete(CMSRedirect.objects.db)
+            CMSRedirect.objects.bulk_create(chunk)
+        updated = len(changed)
+    if created or updated:
+        mark_recent_write(site.pk)
+    return created, updated, unchanged
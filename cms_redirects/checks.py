@@ -0,0 +1,202 @@
+"""Checks of where redirects end up."""
+import multiprocessing
+import urllib2
+from urlparse import urlparse
+
+from cms.models import Page
+from django.conf import settings
+from django.core.urlresolvers import Resolver404, resolve
+from django.test.client import Client
+
+from cms_redirects.models import CMSRedirect
+from cms_redirects.utils import canonical_path, close_connections
+
+
+OK = 'ok'
+BROKEN = 'broken'
+CHAINED = 'chained'
+LOOP = 'loop'
+EXTERNAL = 'external'
+ERROR = 'error'
+
+# The checker used by the worker processes, which inherit it when forked.
+_checker = None
+
+
+class RedirectChecker(object):
+    """Checks the destinations of the redirects of a site.
+
+    Destinations on the site are requested in-process with the test
+    client, spread over ``workers`` processes. A destination that is itself
+    redirected is followed through the site's redirects, up to
+    ``max_hops`` of them, to tell chains from loops. Other sites are only
+    requested if ``external`` is set.
+    """
+    def __init__(self, site, workers=8, max_hops=10, external=False,
+                 timeout=10):
+        self.site = site
+        self.workers = workers
+        self.max_hops = max_hops
+        self.external = external
+        self.timeout = timeout
+        self.sources = {}
+        self.page_urls = {}
+        self.client = None
+
+    def load(self):
+        """Load the redirects of the site, returning them as tuples."""
+        rows = list(CMSRedirect.objects.filter(site=self.site).order_by(
+            'pk').values_list('old_path', 'new_path', 'page_id'))
+        for row in rows:
+            self.sources[canonical_path(row[0])] = row
+        return rows
+
+    def get_client(self):
+        """Get the test client of the current process."""
+        if self.client is None:
+            self.client = Client(HTTP_HOST=self.site.domain)
+        return self.client
+
+    def get_page_url(self, page_id):
+        """Get the url of a page, or None if it is gone."""
+        if page_id not in self.page_urls:
+            try:
+                url = Page.objects.get(pk=page_id).get_absolute_url()
+            except Page.DoesNotExist:
+                url = None
+            self.page_urls[page_id] = url
+        return self.page_urls[page_id]
+
+    def get_destination(self, new_path, page_id):
+        """Get the url a redirect sends people to."""
+        if page_id:
+            return self.get_page_url(page_id)
+        return new_path
+
+    def get_internal_path(self, url):
+        """Get the path of a url on the site, or None for other sites."""
+        parsed = urlparse(url)
+        if parsed.netloc and parsed.netloc != self.site.domain:
+            return None
+        if parsed.query:
+            return '%s?%s' % (parsed.path, parsed.query)
+        return parsed.path
+
+    def get_source(self, path):
+        """Get the redirect from a path, as the middleware would."""
+        candidates = [path]
+        base = path.partition('?')[0]
+        if settings.APPEND_SLASH and base.endswith('/'):
+            candidates.append(path.replace(base, base[:-1], 1))
+        for candidate in candidates:
+            row = self.sources.get(canonical_path(candidate))
+            if row is not None:
+                return row
+        return None
+
+    def check(self, row):
+        """Check one redirect.
+
+        Returns the old path, the destination, the status and details.
+        """
+        old_path, new_path, page_id = row
+        try:
+            if not new_path and not page_id:
+                return old_path, '', OK, 'gone'
+            url = self.get_destination(new_path, page_id)
+            if url is None:
+                return old_path, '', BROKEN, 'page missing'
+            return (old_path, url) + self.check_url(old_path, url)
+        except Exception, error:
+            return old_path, new_path, ERROR, repr(error)
+
+    def check_url(self, old_path, url):
+        """Check a destination, returning its status and details."""
+        seen = set([canonical_path(old_path)])
+        hops = 0
+        path = self.get_internal_path(url)
+        while path is not None:
+            source = self.get_source(path)
+            if source is None:
+                break
+            if canonical_path(source[0]) in seen or hops >= self.max_hops:
+                return LOOP, 'after %s redirects' % (hops + 1)
+            seen.add(canonical_path(source[0]))
+            hops += 1
+            url = self.get_destination(source[1], source[2])
+            if not url:
+                return CHAINED, 'to gone %s' % source[0]
+            path = self.get_internal_path(url)
+        if path is None:
+            status, detail = self.check_external(url)
+        else:
+            status, detail = self.check_internal(path)
+        if hops and status == OK:
+            return CHAINED, '%s redirects to %s' % (hops, url)
+        return status, detail
+
+    def check_internal(self, path):
+        """Request a path on the site, returning its status and details."""
+        try:
+            resolve(path.partition('?')[0])
+        except Resolver404:
+            return BROKEN, 'no url pattern'
+        response = self.get_client().get(path)
+        code = response.status_code
+        if 200 <= code < 300:
+            return OK, str(code)
+        if code in (301, 302, 303, 307):
+            return CHAINED, '%s to %s' % (code, response['Location'])
+        if code in (404, 410):
+            return BROKEN, str(code)
+        return ERROR, str(code)
+
+    def is_shadowed(self, old_path):
+        """Returns whether a path serves content, so is never redirected."""
+        response = self.get_client().get(old_path)
+        return 200 <= response.status_code < 300
+
+    def check_external(self, url):
+        """Request a url on another site if asked to."""
+        if not self.external:
+            return EXTERNAL, 'not checked'
+        request = urllib2.Request(url)
+        request.get_method = lambda: 'HEAD'
+        try:
+            response = urllib2.urlopen(request, timeout=self.timeout)
+        except urllib2.HTTPError, error:
+            if error.code in (404, 410):
+                return BROKEN, str(error.code)
+            return ERROR, str(error.code)
+        except Exception, error:
+            return ERROR, repr(error)
+        return OK, str(response.getcode())
+
+    def run(self, rows):
+        """Check the redirects, yielding results as they are ready.
+
+        Worker processes are forked, so they start with the redirects
+        loaded by this one, and open database connections of their own.
+        The test client is not safe to share between threads, and the
+        checks are mostly spent in python, so threads would not help.
+        """
+        global _checker
+        if self.workers <= 1 or len(rows) <= 1:
+            for row in rows:
+                yield self.check(row)
+            return
+        _checker = self
+        pool = multiprocessing.Pool(min(self.workers, len(rows)),
+                                    initializer=close_connections)
+        try:
+            for result in pool.imap_unordered(check_row, rows):
+                yield result
+        finally:
+            pool.close()
+            pool.join()
+            _checker = None
+
+
+def check_row(row):
+    """Check one redirect in a worker process."""
+    return _checker.check(row)
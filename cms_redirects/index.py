@@ -0,0 +1,576 @@
+"""In-memory index of redirects used by the middleware."""
+import heapq
+import threading
+import time
+import uuid
+from array import array
+from bisect import bisect_left
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils import timezone
+
+from cms_redirects.models import (
+    CMSRedirect, CMSRedirectRevision, CMSRedirectTombstone,
+    QUERY_HANDLING_CHOICES)
+from cms_redirects.utils import (
+    canonical_path, close_connections, parse_query, path_hash, split_path,
+    to_bytes)
+
+
+SNAPSHOT_KEY = 'cms_redirects:snapshot:%s'
+SNAPSHOT_CHUNK_KEY = 'cms_redirects:snapshot:%s:%s:%s'
+
+# The query string handlings, stored in tables by position.
+QUERY_HANDLINGS = [value for value, label in QUERY_HANDLING_CHOICES]
+
+# Columns fetched when loading an index, without building model instances.
+FIELDS = (
+    'id',
+    'old_path',
+    'old_path_hash',
+    'new_path',
+    'page_id',
+    'response_code',
+    'query_handling',
+    'valid_from',
+    'valid_until',
+    'updated_at',
+)
+
+
+def hash_array():
+    """Returns an empty sequence to hold 64-bit path hashes.
+
+    Python 2 arrays have no 64-bit type code of their own. ``'l'`` is 64
+    bits on most 64-bit platforms; elsewhere, such as on Windows, a list
+    has to do.
+    """
+    if array('l').itemsize == 8:
+        return array('l')
+    return []
+
+
+def pending_revision(using):
+    """Returns the lowest revision a change not visible yet can have.
+
+    On PostgreSQL rows carry the id of the transaction that wrote them,
+    and that is the oldest transaction still in progress, however long
+    it has been running. Elsewhere revisions are committed in order, so
+    it is the one after the latest committed.
+    """
+    connection = connections[using]
+    if connection.vendor == 'postgresql':
+        cursor = connection.cursor()
+        cursor.execute('SELECT txid_snapshot_xmin(txid_current_snapshot())')
+        return cursor.fetchone()[0]
+    latest = list(CMSRedirectRevision.objects.using(using).filter(
+        pk=1).values_list('value', flat=True))
+    return (latest[0] if latest else 0) + 1
+
+
+class RedirectTable(object):
+    """Compact, read-only table of the redirects from plain paths.
+
+    Rows are kept in order of the hash of their path, in parallel arrays:
+
+    * ``hashes``: the 64-bit path hash, searched with bisect (8 bytes).
+    * ``ids``: the primary key (4 bytes).
+    * ``offsets``: where the path starts in ``paths``, a single buffer
+      holding every path one after the other (4 bytes plus the path).
+    * ``codes``: the response code less 300 (1 byte).
+    * ``new_offsets``: where the new path starts in ``new_paths``, a
+      buffer like ``paths`` (4 bytes plus the new path).
+    * ``page_ids``: the page redirected to, or 0 (4 bytes).
+    * ``queries``: the query string handling, as its position in
+      ``QUERY_HANDLING_CHOICES`` (1 byte).
+
+    That is 26 bytes per redirect plus the length of its path and of its
+    new path, as utf-8, whether or not redirects share a destination.
+    """
+    def __init__(self, site_id):
+        self.site_id = site_id
+        self.hashes = hash_array()
+        self.ids = array('i')
+        self.offsets = array('I', [0])
+        self.paths = bytearray()
+        self.codes = array('B')
+        self.new_offsets = array('I', [0])
+        self.new_paths = bytearray()
+        self.page_ids = array('i')
+        self.queries = array('B')
+
+    def __len__(self):
+        return len(self.ids)
+
+    def append(self, row):
+        """Add a redirect, rows have to be added in order of path hash."""
+        self.hashes.append(row['old_path_hash'])
+        self.ids.append(row['id'])
+        self.paths.extend(to_bytes(row['old_path']))
+        self.offsets.append(len(self.paths))
+        if row['response_code'].isdigit():
+            self.codes.append(int(row['response_code']) - 300)
+        else:
+            self.codes.append(0)
+        self.new_paths.extend(to_bytes(row['new_path']))
+        self.new_offsets.append(len(self.new_paths))
+        self.page_ids.append(row['page_id'] or 0)
+        self.queries.append(QUERY_HANDLINGS.index(row['query_handling']))
+
+    def find(self, path):
+        """Returns the row holding the redirect from path, or None."""
+        key = path_hash(path)
+        row = bisect_left(self.hashes, key)
+        while row < len(self.hashes) and self.hashes[row] == key:
+            # Different paths can share a hash.
+            if self.path(row) == path:
+                return row
+            row += 1
+        return None
+
+    def path(self, row):
+        """Returns the path redirected from by a row."""
+        return str(self.paths[self.offsets[row]:self.offsets[row + 1]])
+
+    def new_path(self, row):
+        """Returns the path redirected to by a row."""
+        return str(self.new_paths[
+            self.new_offsets[row]:self.new_offsets[row + 1]])
+
+    def redirect(self, row):
+        """Returns an unsaved CMSRedirect for a row."""
+        code = self.codes[row]
+        return CMSRedirect(
+            id=self.ids[row],
+            site_id=self.site_id,
+            old_path=self.path(row).decode('utf-8'),
+            old_path_hash=self.hashes[row],
+            new_path=self.new_path(row).decode('utf-8'),
+            page_id=self.page_ids[row] or None,
+            response_code=code and str(300 + code) or u'',
+            query_handling=QUERY_HANDLINGS[self.queries[row]]
+        )
+
+
+class RedirectIndex(object):
+    """The redirects of one site, keyed by path and query parameters.
+
+    Redirects from a plain path that are not scheduled, which is most of
+    them, are loaded into a compact ``RedirectTable``. The others, and
+    every redirect changed since loading, are kept as model instances in
+    ``redirects``; the table's copy of a changed redirect is hidden by
+    putting its id in ``masked``.
+
+    For those, ``rules`` maps a path to a dict keyed by the names of the
+    query parameters a redirect matches on, which in turn maps the values
+    of those parameters to the redirect. Matching a request takes one
+    lookup per possible path and one per set of parameter names used with
+    that path, however many redirects there are.
+
+    Only redirects active right now are in ``rules``. The times scheduled
+    redirects start or stop are kept in the ``boundaries`` heap, so each
+    lookup only has to compare the clock with the earliest of them.
+
+    After loading, ``sync`` only fetches the redirects written and the
+    tombstones left from the ``revision`` on that was pending at the last
+    sync.
+
+    Redirects are read from the ``REDIRECT_READ_DATABASE`` database,
+    which can be a read replica.
+    """
+    def __init__(self, site_id):
+        self.site_id = site_id
+        self.using = getattr(
+            settings, 'REDIRECT_READ_DATABASE', DEFAULT_DB_ALIAS)
+        self.lock = threading.RLock()
+        self.synced = None
+        self.reset()
+
+    def reset(self):
+        """Forget every redirect."""
+        self.table = RedirectTable(self.site_id)
+        self.masked = set()
+        self.redirects = {}
+        self.rules = {}
+        self.boundaries = []
+        self.revision = None
+
+    def queryset(self):
+        """Get the redirects of the site as dicts, in hash order."""
+        return CMSRedirect.objects.using(self.using).filter(
+            site=self.site_id).order_by('old_path_hash').values(*FIELDS)
+
+    def fetch(self):
+        """Yield every redirect of the site as a dict, in hash order.
+
+        Redirects are fetched ``REDIRECT_INDEX_CHUNK_SIZE`` at a time along
+        the (site, old_path_hash) index, so neither the database nor
+        python has to hold all of them at once.
+        """
+        size = getattr(settings, 'REDIRECT_INDEX_CHUNK_SIZE', 10000)
+        queryset = self.queryset()
+        rows = list(queryset[:size])
+        while rows:
+            for row in rows:
+                yield row
+            if len(rows) < size:
+                break
+            rows = list(queryset.filter(
+                old_path_hash__gt=rows[-1]['old_path_hash'])[:size])
+
+    def load(self):
+        """Load every redirect for the site.
+
+        Redirects are read from the snapshot in the cache, if there is a
+        whole one, and synced with the database from there. Otherwise
+        they are read from the database.
+        """
+        with self.lock:
+            snapshot = cache.get(SNAPSHOT_KEY % self.site_id)
+            if snapshot is not None:
+                try:
+                    self.fill(read_snapshot(self.site_id, snapshot))
+                except SnapshotMissing:
+                    self.reset()
+                else:
+                    self.revision = snapshot['revision']
+                    self.sync()
+                    return
+            # Rows written from here on are fetched again by the next sync.
+            self.revision = pending_revision(self.using)
+            self.fill(self.fetch())
+            self.synced = time.time()
+
+    def fill(self, rows):
+        """Add redirects given as dicts of FIELDS, in hash order."""
+        now = timezone.now()
+        for row in rows:
+            if ('?' in row['old_path'] or row['valid_from'] or
+                    row['valid_until']):
+                redirect = CMSRedirect(site_id=self.site_id, **row)
+                self.redirects[redirect.pk] = redirect
+                self.add(redirect, now)
+            else:
+                self.table.append(row)
+
+    def sync(self):
+        """Apply the redirects changed or deleted since the last sync.
+
+        Rows are fetched from the revision that was pending at the last
+        sync, so a transaction committed late is still picked up. On
+        PostgreSQL, rows written after the oldest transaction still in
+        progress are fetched again until it ends.
+        """
+        with self.lock:
+            revision = pending_revision(self.using)
+            for redirect_id in CMSRedirectTombstone.objects.using(
+                    self.using).filter(
+                        site=self.site_id,
+                        revision__gte=self.revision
+                    ).values_list('redirect_id', flat=True):
+                self.discard(redirect_id)
+
+            redirects = CMSRedirect.objects.using(self.using).filter(
+                site=self.site_id, revision__gte=self.revision)
+            now = timezone.now()
+            for redirect in redirects.order_by('pk').iterator():
+                self.discard(redirect.pk)
+                self.redirects[redirect.pk] = redirect
+                self.add(redirect, now)
+            self.revision = revision
+            self.synced = time.time()
+
+    def needs_rebuild(self):
+        """Returns whether enough has changed to be worth a fresh load."""
+        return len(self.masked) > max(1000, len(self.table) // 10)
+
+    def discard(self, redirect_id):
+        """Forget about a redirect."""
+        self.masked.add(redirect_id)
+        redirect = self.redirects.pop(redirect_id, None)
+        if redirect is not None:
+            self.remove(redirect)
+
+    def add(self, redirect, now):
+        """Add a redirect to the index, or schedule it to be added."""
+        if redirect.valid_until and now >= redirect.valid_until:
+            return
+        if redirect.valid_from and now < redirect.valid_from:
+            self.schedule(redirect.valid_from, redirect)
+            return
+        path, params = split_path(redirect.old_path)
+        names = tuple(name for name, value in params)
+        values = tuple(value for name, value in params)
+        self.rules.setdefault(path, {}).setdefault(names, {})[values] = (
+            redirect)
+        if redirect.valid_until:
+            self.schedule(redirect.valid_until, redirect)
+
+    def remove(self, redirect):
+        """Remove a redirect from the index."""
+        path, params = split_path(redirect.old_path)
+        names = tuple(name for name, value in params)
+        values = tuple(value for name, value in params)
+        rules = self.rules.get(path, {})
+        redirects = rules.get(names, {})
+        if values in redirects and redirects[values].pk == redirect.pk:
+            del redirects[values]
+            if not redirects:
+                del rules[names]
+            if not rules:
+                del self.rules[path]
+
+    def schedule(self, when, redirect):
+        """Revisit a redirect once the given time has passed."""
+        heapq.heappush(self.boundaries, (when, redirect.pk, redirect))
+
+    def due(self, now):
+        """Returns whether a scheduled redirect starts or stops by now.
+
+        Read without the lock, another thread may be changing the heap.
+        """
+        try:
+            return self.boundaries[0][0] <= now
+        except IndexError:
+            return False
+
+    def update(self, now):
+        """Start and stop the redirects scheduled up to now.
+
+        If another thread holds the lock, loading, syncing or updating,
+        this is left to it or the next lookup rather than waited for.
+        """
+        if not self.lock.acquire(False):
+            return
+        try:
+            while self.boundaries and self.boundaries[0][0] <= now:
+                when, pk, redirect = heapq.heappop(self.boundaries)
+                if self.redirects.get(pk) is not redirect:
+                    # The redirect has changed or gone since.
+                    continue
+                if redirect.is_active(now):
+                    self.add(redirect, now)
+                else:
+                    self.remove(redirect)
+        finally:
+            self.lock.release()
+
+    def lookup(self, possible_paths, query=''):
+        """Get the redirect matching any of the paths and the query.
+
+        Redirects matching on more query parameters win, then the latest.
+        """
+        now = None
+        if self.boundaries:
+            now = timezone.now()
+            if self.due(now):
+                self.update(now)
+        params = parse_query(query)
+        best = None
+        best_key = None
+        best_row = None
+        for path in possible_paths:
+            path = to_bytes(path)
+            row = self.table.find(path)
+            if row is not None and self.table.ids[row] not in self.masked:
+                key = (0, self.table.ids[row])
+                if best_key is None or key > best_key:
+                    best, best_key, best_row = None, key, row
+            rules = self.rules.get(path)
+            if not rules:
+                continue
+            # items() rather than iteritems(), another thread may be
+            # changing the index.
+            for names, redirects in rules.items():
+                try:
+                    values = tuple(params[name] for name in names)
+                except KeyError:
+                    continue
+                redirect = redirects.get(values)
+                if redirect is None:
+                    continue
+                if now is not None and not redirect.is_active(now):
+                    # Due to stop, but another thread held the lock.
+                    continue
+                key = (len(names), redirect.pk)
+                if best_key is None or key > best_key:
+                    best, best_key, best_row = redirect, key, None
+        if best_row is not None:
+            return self.table.redirect(best_row)
+        return best
+
+
+def database_redirects(site_id, paths, using=None):
+    """Get the queryset of redirects from any of the paths.
+
+    Redirects are looked up by path hash, so the database answers from
+    the (site, old_path_hash) index. The default ordering is cleared so it
+    does not need to sort. Different paths can share a hash, the paths of
+    the redirects still need checking.
+    """
+    return CMSRedirect.objects.using(using or DEFAULT_DB_ALIAS).filter(
+        site=site_id,
+        old_path_hash__in=[path_hash(path) for path in paths]
+    ).order_by()
+
+
+def lookup_database(site_id, possible_paths, query='', using=None):
+    """Get the redirect matching any of the paths from the database.
+
+    Used when an index may be missing a redirect just saved. Only
+    redirects matching on none or all of the query parameters are found.
+    """
+    candidates = set()
+    for path in possible_paths:
+        candidates.add(canonical_path(path))
+        if query:
+            candidates.add(canonical_path('%s?%s' % (path, query)))
+    now = timezone.now()
+    matches = [
+        redirect
+        for redirect in database_redirects(site_id, candidates, using)
+        if canonical_path(redirect.old_path) in candidates and
+        redirect.is_active(now)
+    ]
+    if not matches:
+        return None
+    return max(matches, key=lambda redirect: (
+        len(split_path(redirect.old_path)[1]), redirect.pk))
+
+
+class SnapshotMissing(Exception):
+    """Raised when part of a snapshot has gone from the cache."""
+
+
+def write_snapshot(site_id):
+    """Store the redirects of a site in the cache for processes to load.
+
+    Rows are stored ``REDIRECT_SNAPSHOT_CHUNK_SIZE`` (2000) at a time,
+    under keys unique to the snapshot, followed by the description of the
+    snapshot, so processes never see half of one. Snapshots are kept for
+    ``REDIRECT_SNAPSHOT_TIMEOUT`` seconds (a day). Processes loading one
+    sync it from the database straight away, so tombstones have to be
+    kept at least that long.
+
+    Returns the number of redirects stored.
+    """
+    size = getattr(settings, 'REDIRECT_SNAPSHOT_CHUNK_SIZE', 2000)
+    timeout = getattr(settings, 'REDIRECT_SNAPSHOT_TIMEOUT', 60 * 60 * 24)
+    index = RedirectIndex(site_id)
+    revision = pending_revision(index.using)
+    version = uuid.uuid4().hex
+    count = chunks = 0
+    chunk = []
+    for row in index.fetch():
+        chunk.append(tuple(row[name] for name in FIELDS))
+        if len(chunk) >= size:
+            cache.set(SNAPSHOT_CHUNK_KEY % (site_id, version, chunks), chunk,
+                      timeout)
+            count += len(chunk)
+            chunks += 1
+            chunk = []
+    if chunk:
+        cache.set(SNAPSHOT_CHUNK_KEY % (site_id, version, chunks), chunk,
+                  timeout)
+        count += len(chunk)
+        chunks += 1
+    cache.set(SNAPSHOT_KEY % site_id, {
+        'version': version,
+        'chunks': chunks,
+        'revision': revision,
+    }, timeout)
+    return count
+
+
+def read_snapshot(site_id, snapshot):
+    """Yield the rows of a snapshot as dicts, a chunk at a time."""
+    for number in range(snapshot['chunks']):
+        chunk = cache.get(
+            SNAPSHOT_CHUNK_KEY % (site_id, snapshot['version'], number))
+        if chunk is None:
+            raise SnapshotMissing(number)
+        for row in chunk:
+            yield dict(zip(FIELDS, row))
+
+
+_indexes = {}
+_lock = threading.Lock()
+
+
+def get_index(site_id):
+    """Get the index for a site, loading or syncing it when due.
+
+    Indexes are synced at most every ``REDIRECT_INDEX_SYNC_INTERVAL``
+    seconds, and loaded afresh once many redirects have changed.
+    """
+    index = _indexes.get(site_id)
+    if index is None:
+        with _lock:
+            index = _indexes.get(site_id)
+            if index is None:
+                index = RedirectIndex(site_id)
+                index.load()
+                _indexes[site_id] = index
+        return index
+    if index.needs_rebuild():
+        # Only one thread needs to load it again, the others go on with the
+        # index as it is.
+        if _lock.acquire(False):
+            try:
+                if _indexes.get(site_id) is index:
+                    index = RedirectIndex(site_id)
+                    index.load()
+                    _indexes[site_id] = index
+            finally:
+                _lock.release()
+        return index
+    interval = getattr(settings, 'REDIRECT_INDEX_SYNC_INTERVAL', 5)
+    if time.time() - index.synced >= interval:
+        # Only one thread needs to sync, the others go on with the index
+        # as it is.
+        if index.lock.acquire(False):
+            try:
+                index.sync()
+            finally:
+                index.lock.release()
+    return index
+
+
+def clear():
+    """Throw away the indexes held by this process."""
+    _indexes.clear()
+
+
+def warm(site_ids):
+    """Load the indexes of the sites."""
+    for site_id in site_ids:
+        get_index(site_id)
+
+
+def warm_in_background(site_ids):
+    """Load the indexes of the sites, closing the thread's connections."""
+    try:
+        warm(site_ids)
+    finally:
+        close_connections()
+
+
+def prewarm():
+    """Load the indexes of the ``REDIRECT_PREWARM_SITES``.
+
+    They are loaded in a background thread, which is returned, if
+    ``REDIRECT_PREWARM_BACKGROUND`` is set. Requests needing an index
+    still being loaded wait for it.
+    """
+    site_ids = getattr(settings, 'REDIRECT_PREWARM_SITES', ())
+    if not site_ids:
+        return None
+    if getattr(settings, 'REDIRECT_PREWARM_BACKGROUND', False):
+        thread = threading.Thread(target=warm_in_background, args=(site_ids,))
+        thread.daemon = True
+        thread.start()
+        return thread
+    warm(site_ids)
+    return None
@@ -0,0 +1,80 @@
+import csv
+import sys
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from cms_redirects.checks import RedirectChecker
+from cms_redirects.management.utils import csv_safe, get_site
+
+
+class Command(BaseCommand):
+    can_import_settings = True
+    help = '''
+
+    Checks where every redirect of a site ends up and writes a csv file of
+    the results to stdout, or to --output. Each redirect is reported as ok,
+    broken, chained (ends up somewhere after more redirects), loop or
+    external (on another site and not checked unless --external is given).
+
+    Destinations on the site are requested in-process, so this has to be run
+    with the settings of the site being checked.
+
+    Usage:
+    ./manage.py check_redirects > checks.csv
+    ./manage.py check_redirects --workers 16 --external --output checks.csv
+
+    '''
+    option_list = BaseCommand.option_list + (
+            make_option('--site',
+                dest="site",
+                default=None,
+                help="Use to specify the domain of the site whose redirects to check.  Defaults to current site."),
+            make_option('--workers',
+                dest="workers",
+                type="int",
+                default=8,
+                help="Number of processes checking redirects, defaults to 8"),
+            make_option('--max-hops',
+                dest="max_hops",
+                type="int",
+                default=10,
+                help="Number of redirects to follow before calling it a loop, defaults to 10"),
+            make_option('--external',
+                action='store_true',
+                dest="external",
+                default=False,
+                help="Also request destinations on other sites"),
+            make_option('--timeout',
+                dest="timeout",
+                type="int",
+                default=10,
+                help="Seconds to wait for other sites, defaults to 10"),
+            make_option('--output',
+                dest="output",
+                default=None,
+                help="File to write the csv to, defaults to stdout"),
+            )
+
+    def execute(self, *args, **options):
+        if options["workers"] < 1:
+            raise CommandError("Must use at least one worker")
+        checker = RedirectChecker(get_site(options["site"]),
+                                  workers=options["workers"],
+                                  max_hops=options["max_hops"],
+                                  external=options["external"],
+                                  timeout=options["timeout"])
+        rows = checker.load()
+        if options["output"]:
+            output = open(options["output"], "wb")
+        else:
+            output = sys.stdout
+        try:
+            writer = csv.writer(output)
+            writer.writerow(['Old Url', 'Destination', 'Status', 'Detail'])
+            for result in checker.run(rows):
+                writer.writerow([csv_safe(value) for value in result])
+                output.flush()
+        finally:
+            if output is not sys.stdout:
+                output.close()
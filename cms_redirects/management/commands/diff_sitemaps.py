@@ -0,0 +1,124 @@
+import csv
+import sys
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from cms_redirects.bulk import load_redirects
+from cms_redirects.management.utils import csv_safe, get_site
+from cms_redirects.models import CMSRedirect, DEFAULT_REDIRECT_RESPONSE_CODE
+from cms_redirects.sitemap_diff import (
+    EXACT, FUZZY, SitemapMatcher, iter_sitemap)
+
+
+class Command(BaseCommand):
+    can_import_settings = True
+    help = '''
+
+    Compares the sitemap of a site before and after a restructuring and
+    redirects the urls that are gone to the new urls most like them: the
+    url with the same slug if there is one, or else the url with the most
+    similar slug. Writes a csv file that can be used to import redirects to
+    stdout, or to --output, or creates the redirects with --load.
+
+    Usage:
+    ./manage.py diff_sitemaps old_sitemap.xml new_sitemap.xml > import.csv
+    ./manage.py diff_sitemaps old_sitemap.xml new_sitemap.xml --load
+
+    '''
+    args = "<old_sitemap_path> <new_sitemap_path>"
+    option_list = BaseCommand.option_list + (
+            make_option('--site',
+                dest="site",
+                default=None,
+                help="Use to specify the domain of the site to load redirects into.  Defaults to current site."),
+            make_option('--threshold',
+                dest="threshold",
+                type="float",
+                default=0.5,
+                help="How similar slugs have to be to match, from 0 to 1, defaults to 0.5"),
+            make_option('--response-code',
+                dest="response_code",
+                default='301',
+                help="Response code of the redirects, 301 or 302, defaults to 301"),
+            make_option('--gone',
+                action='store_true',
+                dest="gone",
+                default=False,
+                help="Also include urls that match nothing, to answer them with a 410"),
+            make_option('--load',
+                action='store_true',
+                dest="load",
+                default=False,
+                help="Create the redirects instead of writing a csv file"),
+            make_option('--chunk-size',
+                dest="chunk_size",
+                type="int",
+                default=1000,
+                help="Number of redirects to create at a time, defaults to 1000"),
+            make_option('--output',
+                dest="output",
+                default=None,
+                help="File to write the csv to, defaults to stdout"),
+            )
+
+    def execute(self, *args, **options):
+        self.verbosity = int(options.get("verbosity", 1))
+        if len(args) != 2:
+            raise CommandError("Must pass in the paths of the old and new sitemaps")
+        if options["response_code"] not in ['301', '302']:
+            raise CommandError("Response code must be 301 or 302")
+        site = get_site(options["site"])
+        self.counts = {EXACT: 0, FUZZY: 0, 'unmatched': 0}
+
+        matcher = SitemapMatcher(options["threshold"])
+        for path in iter_sitemap(args[1]):
+            matcher.add(path)
+        rows = self.get_rows(matcher, iter_sitemap(args[0]),
+                             options["response_code"], options["gone"])
+
+        if options["load"]:
+            created, skipped = load_redirects(
+                site,
+                (self.get_redirect(*row) for row in rows),
+                options["chunk_size"])
+            self.report("Created %s redirects, skipped %s existing\n"
+                        % (created, skipped))
+        else:
+            self.write_csv(rows, options["output"])
+        self.report("Matched %(exact)s by slug and %(fuzzy)s by"
+                    " similarity, %(unmatched)s unmatched\n" % self.counts)
+
+    def report(self, message):
+        if self.verbosity:
+            sys.stderr.write(message)
+
+    def get_rows(self, matcher, old_paths, response_code, gone):
+        """Yield the old path, new path and response code of redirects."""
+        for path in old_paths:
+            match = matcher.match(path)
+            if match is not None:
+                self.counts[match[1]] += 1
+                yield path, match[0], response_code
+            elif path not in matcher.paths:
+                self.counts['unmatched'] += 1
+                if gone:
+                    yield path, '', '410'
+
+    def get_redirect(self, old_path, new_path, response_code):
+        """Make a redirect from a row, redirects nowhere are gone anyway."""
+        if response_code == '410':
+            response_code = DEFAULT_REDIRECT_RESPONSE_CODE
+        return CMSRedirect(old_path=old_path, new_path=new_path,
+                           response_code=response_code)
+
+    def write_csv(self, rows, path):
+        output = open(path, "wb") if path else sys.stdout
+        try:
+            writer = csv.writer(output)
+            writer.writerow(['Old Url', 'New Url', 'Response Code'])
+            for row in rows:
+                writer.writerow([csv_safe(value) for value in row])
+        finally:
+            if output is not sys.stdout:
+                output.close()
@@ -7,6 +7,7 @@ from django.contrib.sites.models import Site
 from django.core.exceptions import ObjectDoesNotExist
 
 from cms_redirects.models import CMSRedirect
+from cms_redirects.utils import path_hash
 
 class Command(BaseCommand):
     can_import_settings = True
@@ -47,7 +48,7 @@ class Command(BaseCommand):
             resp_code = row["Response Code"]
             if resp_code not in ['301', '302']:
                 resp_code = '301'
-            redirect, created = CMSRedirect.objects.get_or_create(site=current_site, old_path=old_url)
+            redirect, created = CMSRedirect.objects.get_or_create(site=current_site, old_path_hash=path_hash(old_url), defaults={"old_path": old_url})
             redirect.new_path = new_url
             redirect.response_code = resp_code
             redirect.save()
@@ -0,0 +1,113 @@
+import os
+import sys
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from cms_redirects import rewrite_rules
+from cms_redirects.bulk import load_redirects
+from cms_redirects.management.utils import get_site
+from cms_redirects.models import CMSRedirect, DEFAULT_REDIRECT_RESPONSE_CODE
+
+
+class Command(BaseCommand):
+    can_import_settings = True
+    help = '''
+
+    Imports the redirects in an nginx or Apache configuration file: nginx
+    rewrite and map directives and return directives in location blocks,
+    and Apache Redirect, RedirectMatch and RewriteRule directives.
+
+    Only rules matching one path can be imported: exact matches and regular
+    expressions of a literal path like ^/old\.html$. Rules that can not be
+    imported are listed on stderr with the line they are on. Paths that
+    already have a redirect are skipped.
+
+    Usage:
+    ./manage.py import_redirect_rules /etc/nginx/sites-enabled/example.conf
+    ./manage.py import_redirect_rules .htaccess --format apache
+
+    '''
+    args = "<config_path>"
+    option_list = BaseCommand.option_list + (
+            make_option('--site',
+                dest="site",
+                default=None,
+                help="Use to specify the domain of the site you are importing redirects into.  Defaults to current site."),
+            make_option('--format',
+                dest="format",
+                type="choice",
+                choices=["nginx", "apache"],
+                default=None,
+                help="nginx or apache. By default apache if any line is an Apache directive or section, or if there are no nginx statements, and nginx otherwise"),
+            make_option('--map-response-code',
+                dest="map_response_code",
+                default='301',
+                help="Response code of the redirects in nginx maps, 301 or 302, defaults to 301"),
+            make_option('--prefix-as-exact',
+                action='store_true',
+                dest="prefix_as_exact",
+                default=False,
+                help="Import rules matching a prefix as redirects of the prefix alone"),
+            make_option('--chunk-size',
+                dest="chunk_size",
+                type="int",
+                default=1000,
+                help="Number of redirects to create at a time, defaults to 1000"),
+            )
+
+    def execute(self, *args, **options):
+        if len(args) != 1:
+            raise CommandError("Must pass in the path of the configuration file")
+        config_path = args[0]
+        if not os.path.exists(config_path):
+            raise CommandError("File not found, invalid path: %s" % config_path)
+        if options["map_response_code"] not in ['301', '302']:
+            raise CommandError("Map response code must be 301 or 302")
+        site = get_site(options["site"])
+        self.verbosity = int(options.get("verbosity", 1))
+        self.counts = dict((kind, 0) for kind in (
+            rewrite_rules.EXACT, rewrite_rules.PREFIX, rewrite_rules.REGEX))
+        self.unsupported = 0
+
+        config_file = open(config_path, "rb")
+        try:
+            rules = rewrite_rules.parse(
+                config_file,
+                format=options["format"],
+                default_status=options["map_response_code"],
+                prefix_as_exact=options["prefix_as_exact"])
+            created, skipped = load_redirects(
+                site, self.get_redirects(rules), options["chunk_size"])
+        finally:
+            config_file.close()
+        if (not sum(self.counts.values()) and not self.unsupported and
+                os.path.getsize(config_path)):
+            raise CommandError("No redirect rules found in %s, check"
+                               " --format" % config_path)
+
+        self.report("Imported %(exact)s exact, %(prefix)s prefix and"
+                    " %(regex)s regex rules" % self.counts)
+        self.report("Created %s redirects, skipped %s existing, could not"
+                    " import %s rules" % (created, skipped, self.unsupported))
+
+    def get_redirects(self, rules):
+        """Yield a redirect for every rule that can be imported."""
+        for rule in rules:
+            if rule.problem:
+                self.unsupported += 1
+                self.report("Line %s, %s: %s" % (
+                    rule.line, rule.kind, rule.problem))
+                continue
+            self.counts[rule.kind] += 1
+            response_code = rule.response_code
+            if response_code == '410':
+                response_code = DEFAULT_REDIRECT_RESPONSE_CODE
+            yield CMSRedirect(old_path=rule.old_path,
+                              new_path=rule.new_path,
+                              response_code=response_code,
+                              query_handling=rule.query_handling)
+
+    def report(self, message):
+        if self.verbosity:
+            sys.stderr.write(message + "\n")
@@ -0,0 +1,271 @@
+import csv
+import datetime
+import sys
+import time
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from cms_redirects.checks import BROKEN, RedirectChecker
+from cms_redirects.management.utils import csv_safe, get_site
+from cms_redirects.models import CMSRedirect, CMSRedirectTombstone
+from cms_redirects.utils import path_hash
+
+
+class Command(BaseCommand):
+    can_import_settings = True
+    help = '''
+
+    Deletes the redirects of a site matching any of the chosen criteria,
+    a batch at a time so the table is never locked for long:
+
+    --missing-target  redirects to a page that is not published, or to a
+                      path on the site that is not found
+    --older-than N    redirects not changed in N days
+    --expired         redirects whose schedule has ended
+    --duplicates      redirects from a path with a trailing slash doing the
+                      same as the redirect from the path without it
+    --shadowed        redirects from a path that now serves content, which
+                      are never used as redirects only apply to a 404
+
+    Use --backup to write the deleted redirects to a csv file that can be
+    imported again with import_redirect_csv, and --dry-run to only count
+    and back them up.
+
+    Usage:
+    ./manage.py prune_redirects --older-than 730 --dry-run
+    ./manage.py prune_redirects --missing-target --shadowed --backup pruned.csv
+
+    '''
+    option_list = BaseCommand.option_list + (
+            make_option('--site',
+                dest="site",
+                default=None,
+                help="Use to specify the domain of the site to prune redirects of.  Defaults to current site."),
+            make_option('--missing-target',
+                action='store_true',
+                dest="missing_target",
+                default=False,
+                help="Delete redirects to pages that are not published or paths that are not found"),
+            make_option('--older-than',
+                dest="older_than",
+                type="int",
+                default=None,
+                help="Delete redirects not changed in this many days"),
+            make_option('--expired',
+                action='store_true',
+                dest="expired",
+                default=False,
+                help="Delete redirects whose schedule has ended"),
+            make_option('--duplicates',
+                action='store_true',
+                dest="duplicates",
+                default=False,
+                help="Delete redirects made redundant by the same redirect without a trailing slash"),
+            make_option('--shadowed',
+                action='store_true',
+                dest="shadowed",
+                default=False,
+                help="Delete redirects from paths that serve content"),
+            make_option('--tombstones',
+                dest="tombstones",
+                type="int",
+                default=None,
+                help="Also delete the records of redirects deleted more than this many days ago"),
+            make_option('--batch-size',
+                dest="batch_size",
+                type="int",
+                default=1000,
+                help="Number of redirects to look at and delete at a time, defaults to 1000"),
+            make_option('--sleep',
+                dest="sleep",
+                type="float",
+                default=0.1,
+                help="Seconds to wait between batches, defaults to 0.1"),
+            make_option('--dry-run',
+                action='store_true',
+                dest="dry_run",
+                default=False,
+                help="Count the redirects that would be deleted without deleting them"),
+            make_option('--backup',
+                dest="backup",
+                default=None,
+                help="File to write the deleted redirects to as csv"),
+            )
+
+    def execute(self, *args, **options):
+        self.site = get_site(options["site"])
+        self.verbosity = int(options.get("verbosity", 1))
+        self.now = timezone.now()
+        self.checker = RedirectChecker(self.site)
+        self.errors = 0
+        self.criteria = []
+        if options["missing_target"]:
+            self.criteria.append(('missing target', self.has_missing_target))
+        if options["older_than"] is not None:
+            self.cutoff = self.now - datetime.timedelta(options["older_than"])
+            self.criteria.append(('older', self.is_older))
+        if options["expired"]:
+            self.criteria.append(('expired', self.is_expired))
+        if options["duplicates"]:
+            self.criteria.append(('duplicate', self.is_duplicate))
+        if options["shadowed"]:
+            self.criteria.append(('shadowed', self.is_shadowed))
+        if not self.criteria and options["tombstones"] is None:
+            raise CommandError("Must choose what to prune, see --help")
+        if options["batch_size"] < 1:
+            raise CommandError("Batch size must be at least 1")
+
+        backup = None
+        if options["backup"]:
+            backup_file = open(options["backup"], "wb")
+            backup = csv.writer(backup_file)
+            backup.writerow(['Old Url', 'New Url', 'Response Code'])
+        try:
+            if self.criteria:
+                self.prune(options["batch_size"], options["sleep"],
+                           options["dry_run"], backup)
+        finally:
+            if backup is not None:
+                backup_file.close()
+        if options["tombstones"] is not None:
+            self.prune_tombstones(options["tombstones"], options["batch_size"],
+                                  options["sleep"], options["dry_run"])
+
+    def prune(self, batch_size, sleep, dry_run, backup):
+        """Delete the matching redirects, a batch of primary keys at a time."""
+        counts = dict((name, 0) for name, test in self.criteria)
+        last = 0
+        while True:
+            batch = list(CMSRedirect.objects.filter(
+                site=self.site, pk__gt=last).select_related(
+                'page').order_by('pk')[:batch_size])
+            if not batch:
+                break
+            last = batch[-1].pk
+            self.siblings = self.get_siblings(batch)
+            doomed = []
+            for redirect in batch:
+                for name, test in self.criteria:
+                    if test(redirect):
+                        counts[name] += 1
+                        doomed.append(redirect)
+                        break
+            if backup is not None:
+                for redirect in doomed:
+                    backup.writerow([csv_safe(value)
+                                     for value in backup_row(redirect)])
+            if doomed and not dry_run:
+                with transaction.commit_on_success():
+                    CMSRedirect.objects.filter(
+                        pk__in=[redirect.pk for redirect in doomed]).delete()
+                time.sleep(sleep)
+        verb = "Would delete" if dry_run else "Deleted"
+        for name, test in self.criteria:
+            self.report("%s %s %s redirects" % (verb, counts[name], name))
+        if self.errors:
+            self.report("Kept %s redirects that could not be checked"
+                        % self.errors)
+
+    def prune_tombstones(self, days, batch_size, sleep, dry_run):
+        """Delete the records of redirects deleted long ago."""
+        tombstones = CMSRedirectTombstone.objects.filter(
+            deleted_at__lt=self.now - datetime.timedelta(days))
+        if dry_run:
+            self.report("Would delete %s tombstones" % tombstones.count())
+            return
+        deleted = 0
+        while True:
+            pks = list(tombstones.order_by('pk').values_list(
+                'pk', flat=True)[:batch_size])
+            if not pks:
+                break
+            with transaction.commit_on_success():
+                CMSRedirectTombstone.objects.filter(pk__in=pks).delete()
+            deleted += len(pks)
+            time.sleep(sleep)
+        self.report("Deleted %s tombstones" % deleted)
+
+    def get_siblings(self, batch):
+        """Get the redirects from the paths of a batch without a trailing
+        slash, by hash, if those would be used for the batch's paths."""
+        if not (settings.APPEND_SLASH and
+                any(name == 'duplicate' for name, test in self.criteria)):
+            return {}
+        hashes = [path_hash(sibling_path(r.old_path)) for r in batch
+                  if sibling_path(r.old_path)]
+        siblings = CMSRedirect.objects.filter(
+            site=self.site, old_path_hash__in=hashes)
+        return dict((r.old_path_hash, r) for r in siblings)
+
+    def has_missing_target(self, redirect):
+        if redirect.page_id is not None:
+            return not redirect.page.published
+        if not redirect.new_path:
+            return False
+        path = self.checker.get_internal_path(redirect.new_path)
+        if path is None:
+            return False
+        result = self.request(redirect, self.checker.check_internal, path)
+        return result is not None and result[0] == BROKEN
+
+    def is_older(self, redirect):
+        return redirect.updated_at < self.cutoff
+
+    def is_expired(self, redirect):
+        return (redirect.valid_until is not None and
+                redirect.valid_until <= self.now)
+
+    def is_duplicate(self, redirect):
+        path = sibling_path(redirect.old_path)
+        if not path:
+            return False
+        sibling = self.siblings.get(path_hash(path))
+        return (sibling is not None and
+                sibling.old_path != redirect.old_path and
+                behaviour(sibling) == behaviour(redirect))
+
+    def is_shadowed(self, redirect):
+        return bool(self.request(redirect, self.checker.is_shadowed,
+                                 redirect.old_path))
+
+    def request(self, redirect, check, path):
+        """Run a check that requests a path, counting the errors like
+        RedirectChecker.check() does, and returning None for them."""
+        try:
+            return check(path)
+        except Exception, error:
+            self.errors += 1
+            self.report("Could not check %s: %r" % (redirect.old_path, error))
+            return None
+
+    def report(self, message):
+        if self.verbosity:
+            sys.stderr.write(message + "\n")
+
+
+def sibling_path(path):
+    """Return path without its trailing slash, or None if it has none."""
+    base, separator, query = path.partition('?')
+    if len(base) < 2 or not base.endswith('/'):
+        return None
+    return base[:-1] + separator + query
+
+
+def behaviour(redirect):
+    """Return what a redirect does, to compare it with others."""
+    return (redirect.new_path, redirect.page_id, redirect.response_code,
+            redirect.query_handling, redirect.valid_from,
+            redirect.valid_until)
+
+
+def backup_row(redirect):
+    """Return a redirect as a row for import_redirect_csv."""
+    if redirect.page_id:
+        new_url = redirect.page.get_absolute_url()
+    else:
+        new_url = redirect.new_path
+    return [redirect.old_path, new_url, redirect.actual_response_code()]
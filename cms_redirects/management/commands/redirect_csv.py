@@ -8,6 +8,8 @@ from django.contrib.sites.models import Site
 from django.conf import settings
 from django.utils import simplejson
 
+from cms_redirects.management.utils import csv_safe
+
 from optparse import make_option
 
 class Command(BaseCommand):
@@ -73,11 +75,3 @@ class Command(BaseCommand):
                 
         print output.getvalue()
         
-def csv_safe(s):
-    if isinstance(s,basestring):
-        return s.encode("utf-8")
-    else:
-        return s
-        
-        
-        
\ No newline at end of file
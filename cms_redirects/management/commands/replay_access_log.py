@@ -0,0 +1,86 @@
+import sys
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from cms_redirects.index import get_index
+from cms_redirects.replay import parse_log, run
+
+
+class Command(BaseCommand):
+    can_import_settings = True
+    help = '''
+
+    Replays the requests in an access log in the combined or common format
+    through the redirect middleware, in-process, as if no page had been
+    found for any of them. Reports the throughput, the latency of the
+    middleware, the database queries it made per request and how many
+    requests were redirected.
+
+    Usage:
+    ./manage.py replay_access_log access.log
+    ./manage.py replay_access_log access.log --status 404 --threads 4
+    ./manage.py replay_access_log access.log --processes 4 --cold
+
+    '''
+    args = "<log_path>"
+    option_list = BaseCommand.option_list + (
+            make_option('--threads',
+                dest="threads",
+                type="int",
+                default=1,
+                help="Number of threads replaying requests, defaults to 1"),
+            make_option('--processes',
+                dest="processes",
+                type="int",
+                default=1,
+                help="Number of processes replaying requests, instead of threads"),
+            make_option('--status',
+                dest="statuses",
+                default=None,
+                help="Only replay requests logged with these comma separated statuses, e.g. 404,410"),
+            make_option('--host',
+                dest="host",
+                default=None,
+                help="Host header of the requests"),
+            make_option('--limit',
+                dest="limit",
+                type="int",
+                default=None,
+                help="Only replay the first this many requests"),
+            make_option('--cold',
+                action='store_true',
+                dest="cold",
+                default=False,
+                help="Do not load the redirect index before starting the clock"),
+            )
+
+    def execute(self, *args, **options):
+        if len(args) != 1:
+            raise CommandError("Must pass in the path of the access log")
+        if options["threads"] < 1 or options["processes"] < 1:
+            raise CommandError("Must use at least one thread and process")
+        if options["threads"] > 1 and options["processes"] > 1:
+            raise CommandError("Use either --threads or --processes, not both")
+        statuses = None
+        if options["statuses"]:
+            try:
+                statuses = set(int(s) for s in options["statuses"].split(","))
+            except ValueError:
+                raise CommandError("Statuses must be numbers")
+        try:
+            log_file = open(args[0], "rb")
+        except IOError:
+            raise CommandError("File not found, invalid path: %s" % args[0])
+        try:
+            paths = list(parse_log(log_file, statuses))
+        finally:
+            log_file.close()
+        if options["limit"] is not None:
+            paths = paths[:options["limit"]]
+        if not options["cold"]:
+            get_index(settings.SITE_ID)
+        stats = run(paths, threads=options["threads"],
+                    processes=options["processes"], host=options["host"])
+        sys.stdout.write("\n".join(stats.report()) + "\n")
@@ -0,0 +1,42 @@
+import sys
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from cms_redirects.index import write_snapshot
+from cms_redirects.management.utils import get_site
+
+
+class Command(BaseCommand):
+    can_import_settings = True
+    help = '''
+
+    Stores the redirects of sites in the cache, for processes to load
+    their redirect indexes from rather than from the database. Run it from
+    a deploy hook before new processes start.
+
+    Usage:
+    ./manage.py warm_redirect_cache
+    ./manage.py warm_redirect_cache --site example.com --site example.org
+
+    '''
+    option_list = BaseCommand.option_list + (
+            make_option('--site',
+                action='append',
+                dest="sites",
+                default=None,
+                help="Use to specify the domain of a site to store.  Defaults to the REDIRECT_PREWARM_SITES setting, or else the current site."),
+            )
+
+    def execute(self, *args, **options):
+        if options["sites"]:
+            site_ids = [get_site(domain).pk for domain in options["sites"]]
+        else:
+            site_ids = (getattr(settings, "REDIRECT_PREWARM_SITES", None) or
+                        [get_site().pk])
+        for site_id in site_ids:
+            count = write_snapshot(site_id)
+            if int(options.get("verbosity", 1)):
+                sys.stderr.write("Stored %s redirects of site %s\n"
+                                 % (count, site_id))
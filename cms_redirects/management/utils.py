@@ -0,0 +1,20 @@
+from django.contrib.sites.models import Site
+from django.core.exceptions import ObjectDoesNotExist
+from django.core.management.base import CommandError
+
+
+def get_site(domain=None):
+    """Get the site with a domain, or the current site if none is given."""
+    if domain is None:
+        return Site.objects.get_current()
+    try:
+        return Site.objects.get(domain=domain)
+    except ObjectDoesNotExist:
+        raise CommandError("No site found, invalid domain: %s" % domain)
+
+
+def csv_safe(s):
+    """Return a value as the csv module writes it, unicode as utf-8."""
+    if isinstance(s, unicode):
+        return s.encode("utf-8")
+    return s
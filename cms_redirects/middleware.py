@@ -1,13 +1,25 @@
 """Redirect middleware for Django CMS."""
-from urlparse import urlparse
+from urllib import urlencode
+from urlparse import parse_qsl, urlparse
 
-from cms_redirects.models import CMSRedirect
+from cms_redirects.index import get_index, lookup_database, prewarm
+from cms_redirects.models import QUERY_DROP, QUERY_UNMATCHED
+from cms_redirects.utils import recently_written, split_path, to_bytes
 from django import http
 from django.conf import settings
+from django.utils import translation
 
 
 class RedirectMiddleware(object):
     """Middleware for handling redirects."""
+    def __init__(self):
+        """Load the redirect indexes of settings.REDIRECT_PREWARM_SITES.
+
+        Django makes the middleware when the first request comes in, so
+        this is as early as the indexes can be loaded.
+        """
+        prewarm()
+
     def get_possible_paths(self, parsed_path):
         """Get a list of possible url paths to look for."""
         # Get the usable url parts
@@ -23,6 +35,20 @@ class RedirectMiddleware(object):
 
         return possible_paths
 
+    def split_language_prefix(self, path):
+        """Split the language prefix off a path.
+
+        Returns the language and the rest of the path, or no language and
+        the path as it was if it has no prefix or
+        settings.REDIRECT_IGNORE_LANGUAGE_PREFIX is off.
+        """
+        if not getattr(settings, 'REDIRECT_IGNORE_LANGUAGE_PREFIX', False):
+            return None, path
+        prefix, slash, rest = path[1:].partition('/')
+        if slash and prefix in dict(settings.LANGUAGES):
+            return prefix, '/%s' % rest
+        return None, path
+
     def get_query(self, parsed_path):
         """Get and format query parameters."""
         if parsed_path.query:
@@ -32,15 +58,14 @@ class RedirectMiddleware(object):
 
         return query
 
-    def get_cms_redirect(self, possible_paths):
-        """Get the latest redirect for the specified path."""
-        try:
-            redirect = CMSRedirect.objects.filter(
-                site__id__exact=settings.SITE_ID,
-                old_path__in=possible_paths
-            ).latest('pk')
-        except CMSRedirect.DoesNotExist:
-            redirect = None
+    def get_cms_redirect(self, possible_paths, query=''):
+        """Get the redirect for the specified paths and query string."""
+        redirect = get_index(settings.SITE_ID).lookup(possible_paths, query)
+        if redirect is None and recently_written(settings.SITE_ID):
+            # The index, or the replica it is read from, may not have the
+            # redirect an editor has just saved yet.
+            redirect = lookup_database(
+                settings.SITE_ID, possible_paths, query)
         return redirect
 
     def get_cms_redirect_response_class(self, redirect):
@@ -50,16 +75,46 @@ class RedirectMiddleware(object):
         else:
             return http.HttpResponsePermanentRedirect
 
-    def cms_redirect(self, redirect, query):
+    def get_redirect_query(self, redirect, query):
+        """Get the part of the query string to pass on to the destination."""
+        if redirect.query_handling == QUERY_DROP:
+            return ''
+        if redirect.query_handling == QUERY_UNMATCHED and query:
+            # Parameters matched by the redirect or set by the destination
+            # are not passed on.
+            excluded = set(name for name, value in
+                           split_path(redirect.old_path)[1])
+            if not redirect.page:
+                excluded.update(name for name, value in
+                                split_path(redirect.new_path)[1])
+            query = urlencode([
+                (name, value)
+                for name, value in parse_qsl(
+                    to_bytes(query), keep_blank_values=True)
+                if name not in excluded
+            ])
+        return query
+
+    def get_page_url(self, page, language=None):
+        """Get the url of a page, in the given or the current language."""
+        if language is None:
+            return page.get_absolute_url()
+        with translation.override(language):
+            return page.get_absolute_url(language=language)
+
+    def cms_redirect(self, redirect, query, language=None):
         """Returns the response object."""
         if not redirect.page and not redirect.new_path:
             return http.HttpResponseGone()
 
+        query = self.get_redirect_query(redirect, query)
+
         response_class = self.get_cms_redirect_response_class(redirect)
         if redirect.page:
             if query:
                 query = '?{query}'.format(query=query)
-            redirect_to = '%s%s' % (redirect.page.get_absolute_url(), query)
+            redirect_to = '%s%s' % (
+                self.get_page_url(redirect.page, language), query)
         else:
             if query and '?' in redirect.new_path:
                 query = '&{query}'.format(query=query)
@@ -77,7 +132,16 @@ class RedirectMiddleware(object):
 
         parsed_path = urlparse(request.get_full_path())
         possible_paths = self.get_possible_paths(parsed_path)
-        cms_redirect = self.get_cms_redirect(possible_paths)
+        query = self.get_query(parsed_path)
+        cms_redirect = self.get_cms_redirect(possible_paths, query)
+        language = None
+        if not cms_redirect:
+            # Redirects from the exact path win over those matching any
+            # language.
+            language, path = self.split_language_prefix(parsed_path.path)
+            if language:
+                possible_paths = self.get_possible_paths(
+                    parsed_path._replace(path=path))
+                cms_redirect = self.get_cms_redirect(possible_paths, query)
         if cms_redirect:
-            query = self.get_query(parsed_path)
-            return self.cms_redirect(cms_redirect, query)
+            return self.cms_redirect(cms_redirect, query, language)
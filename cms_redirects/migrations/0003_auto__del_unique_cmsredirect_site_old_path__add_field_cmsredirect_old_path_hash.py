@@ -0,0 +1,98 @@
+# encoding: utf-8
+import datetime
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import models
+
+class Migration(SchemaMigration):
+
+    def forwards(self, orm):
+        
+        # Removing unique constraint on 'CMSRedirect', fields ['site', 'old_path']
+        db.delete_unique('cms_redirects_cmsredirect', ['site_id', 'old_path'])
+
+        # Removing index on 'CMSRedirect', fields ['old_path']
+        db.delete_index('cms_redirects_cmsredirect', ['old_path'])
+
+        # Adding field 'CMSRedirect.old_path_hash'
+        db.add_column('cms_redirects_cmsredirect', 'old_path_hash', self.gf('django.db.models.fields.BigIntegerField')(default=0), keep_default=False)
+
+        # Changing field 'CMSRedirect.old_path'
+        db.alter_column('cms_redirects_cmsredirect', 'old_path', self.gf('django.db.models.fields.CharField')(max_length=2000))
+
+        # Changing field 'CMSRedirect.new_path'
+        db.alter_column('cms_redirects_cmsredirect', 'new_path', self.gf('django.db.models.fields.CharField')(max_length=2000))
+
+
+    def backwards(self, orm):
+        
+        # Changing field 'CMSRedirect.new_path'
+        db.alter_column('cms_redirects_cmsredirect', 'new_path', self.gf('django.db.models.fields.CharField')(max_length=200))
+
+        # Changing field 'CMSRedirect.old_path'
+        db.alter_column('cms_redirects_cmsredirect', 'old_path', self.gf('django.db.models.fields.CharField')(max_length=200))
+
+        # Deleting field 'CMSRedirect.old_path_hash'
+        db.delete_column('cms_redirects_cmsredirect', 'old_path_hash')
+
+        # Adding index on 'CMSRedirect', fields ['old_path']
+        db.create_index('cms_redirects_cmsredirect', ['old_path'])
+
+        # Adding unique constraint on 'CMSRedirect', fields ['site', 'old_path']
+        db.create_unique('cms_redirects_cmsredirect', ['site_id', 'old_path'])
+
+
+    models = {
+        'cms.page': {
+            'Meta': {'ordering': "('tree_id', 'lft')", 'object_name': 'Page'},
+            'changed_by': ('django.db.models.fields.CharField', [], {'max_length': '70'}),
+            'changed_date': ('django.db.models.fields.DateTimeField', [], {'auto_now': 'True', 'blank': 'True'}),
+            'created_by': ('django.db.models.fields.CharField', [], {'max_length': '70'}),
+            'creation_date': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'blank': 'True'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'in_navigation': ('django.db.models.fields.BooleanField', [], {'default': 'True', 'db_index': 'True'}),
+            'level': ('django.db.models.fields.PositiveIntegerField', [], {'db_index': 'True'}),
+            'lft': ('django.db.models.fields.PositiveIntegerField', [], {'db_index': 'True'}),
+            'limit_visibility_in_menu': ('django.db.models.fields.SmallIntegerField', [], {'default': 'None', 'null': 'True', 'db_index': 'True', 'blank': 'True'}),
+            'login_required': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'navigation_extenders': ('django.db.models.fields.CharField', [], {'db_index': 'True', 'max_length': '80', 'null': 'True', 'blank': 'True'}),
+            'parent': ('django.db.models.fields.related.ForeignKey', [], {'blank': 'True', 'related_name': "'children'", 'null': 'True', 'to': "orm['cms.Page']"}),
+            'placeholders': ('django.db.models.fields.related.ManyToManyField', [], {'to': "orm['cms.Placeholder']", 'symmetrical': 'False'}),
+            'publication_date': ('django.db.models.fields.DateTimeField', [], {'db_index': 'True', 'null': 'True', 'blank': 'True'}),
+            'publication_end_date': ('django.db.models.fields.DateTimeField', [], {'db_index': 'True', 'null': 'True', 'blank': 'True'}),
+            'published': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'publisher_is_draft': ('django.db.models.fields.BooleanField', [], {'default': 'True', 'db_index': 'True'}),
+            'publisher_public': ('django.db.models.fields.related.OneToOneField', [], {'related_name': "'publisher_draft'", 'unique': 'True', 'null': 'True', 'to': "orm['cms.Page']"}),
+            'publisher_state': ('django.db.models.fields.SmallIntegerField', [], {'default': '0', 'db_index': 'True'}),
+            'reverse_id': ('django.db.models.fields.CharField', [], {'db_index': 'True', 'max_length': '40', 'null': 'True', 'blank': 'True'}),
+            'rght': ('django.db.models.fields.PositiveIntegerField', [], {'db_index': 'True'}),
+            'site': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['sites.Site']"}),
+            'soft_root': ('django.db.models.fields.BooleanField', [], {'default': 'False', 'db_index': 'True'}),
+            'template': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            'tree_id': ('django.db.models.fields.PositiveIntegerField', [], {'db_index': 'True'})
+        },
+        'cms.placeholder': {
+            'Meta': {'object_name': 'Placeholder'},
+            'default_width': ('django.db.models.fields.PositiveSmallIntegerField', [], {'null': 'True'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'slot': ('django.db.models.fields.CharField', [], {'max_length': '50', 'db_index': 'True'})
+        },
+        u'cms_redirects.cmsredirect': {
+            'Meta': {'ordering': "('old_path',)", 'object_name': 'CMSRedirect'},
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'new_path': ('django.db.models.fields.CharField', [], {'max_length': '2000', 'blank': 'True'}),
+            'old_path': ('django.db.models.fields.CharField', [], {'max_length': '2000'}),
+            'old_path_hash': ('django.db.models.fields.BigIntegerField', [], {}),
+            'page': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['cms.Page']", 'null': 'True', 'blank': 'True'}),
+            'response_code': ('django.db.models.fields.CharField', [], {'default': "'301'", 'max_length': '3'}),
+            'site': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['sites.Site']"})
+        },
+        u'sites.site': {
+            'Meta': {'ordering': "('domain',)", 'object_name': 'Site', 'db_table': "'django_site'"},
+            'domain': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '50'})
+        }
+    }
+
+    complete_apps = ['cms_redirects']
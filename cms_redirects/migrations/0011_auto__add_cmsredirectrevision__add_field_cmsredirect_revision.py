@@ -0,0 +1,157 @@
+# encoding: utf-8
+import datetime
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import models
+
+# On PostgreSQL rows are stamped with the id of the transaction writing
+# them, which the redirect indexes compare with the oldest transaction
+# still in progress.
+POSTGRES_TRIGGERS = (
+    """CREATE OR REPLACE FUNCTION cms_redirects_cmsredirect_touch() RETURNS trigger AS $$
+    BEGIN
+        NEW.updated_at := now();
+        NEW.revision := txid_current();
+        RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql""",
+    """CREATE OR REPLACE FUNCTION cms_redirects_cmsredirect_tombstone() RETURNS trigger AS $$
+    BEGIN
+        INSERT INTO cms_redirects_cmsredirecttombstone (site_id, redirect_id, deleted_at, revision)
+        VALUES (OLD.site_id, OLD.id, now(), txid_current());
+        RETURN OLD;
+    END;
+    $$ LANGUAGE plpgsql""",
+)
+
+# The functions as the previous migration left them.
+OLD_POSTGRES_TRIGGERS = (
+    """CREATE OR REPLACE FUNCTION cms_redirects_cmsredirect_touch() RETURNS trigger AS $$
+    BEGIN
+        NEW.updated_at := now();
+        RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql""",
+    """CREATE OR REPLACE FUNCTION cms_redirects_cmsredirect_tombstone() RETURNS trigger AS $$
+    BEGIN
+        INSERT INTO cms_redirects_cmsredirecttombstone (site_id, redirect_id, deleted_at)
+        VALUES (OLD.site_id, OLD.id, now());
+        RETURN OLD;
+    END;
+    $$ LANGUAGE plpgsql""",
+)
+
+class Migration(SchemaMigration):
+
+    def forwards(self, orm):
+        
+        # Adding model 'CMSRedirectRevision'
+        db.create_table('cms_redirects_cmsredirectrevision', (
+            ('id', self.gf('django.db.models.fields.AutoField')(primary_key=True)),
+            ('value', self.gf('django.db.models.fields.BigIntegerField')(default=0)),
+        ))
+        db.send_create_signal('cms_redirects', ['CMSRedirectRevision'])
+        if not db.dry_run:
+            orm['cms_redirects.CMSRedirectRevision'].objects.create(pk=1, value=0)
+
+        # Adding field 'CMSRedirect.revision'
+        db.add_column('cms_redirects_cmsredirect', 'revision', self.gf('django.db.models.fields.BigIntegerField')(default=0, db_index=True), keep_default=False)
+
+        # Adding field 'CMSRedirectTombstone.revision'
+        db.add_column('cms_redirects_cmsredirecttombstone', 'revision', self.gf('django.db.models.fields.BigIntegerField')(default=0, db_index=True), keep_default=False)
+
+        # Stamping revisions in the triggers on 'CMSRedirect'
+        if db.backend_name == 'postgres':
+            for sql in POSTGRES_TRIGGERS:
+                db.execute(sql)
+
+
+    def backwards(self, orm):
+        
+        # Restoring the triggers on 'CMSRedirect'
+        if db.backend_name == 'postgres':
+            for sql in OLD_POSTGRES_TRIGGERS:
+                db.execute(sql)
+
+        # Deleting field 'CMSRedirectTombstone.revision'
+        db.delete_column('cms_redirects_cmsredirecttombstone', 'revision')
+
+        # Deleting field 'CMSRedirect.revision'
+        db.delete_column('cms_redirects_cmsredirect', 'revision')
+
+        # Deleting model 'CMSRedirectRevision'
+        db.delete_table('cms_redirects_cmsredirectrevision')
+
+
+    models = {
+        'cms.page': {
+            'Meta': {'ordering': "('tree_id', 'lft')", 'object_name': 'Page'},
+            'changed_by': ('django.db.models.fields.CharField', [], {'max_length': '70'}),
+            'changed_date': ('django.db.models.fields.DateTimeField', [], {'auto_now': 'True', 'blank': 'True'}),
+            'created_by': ('django.db.models.fields.CharField', [], {'max_length': '70'}),
+            'creation_date': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'blank': 'True'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'in_navigation': ('django.db.models.fields.BooleanField', [], {'default': 'True', 'db_index': 'True'}),
+            'level': ('django.db.models.fields.PositiveIntegerField', [], {'db_index': 'True'}),
+            'lft': ('django.db.models.fields.PositiveIntegerField', [], {'db_index': 'True'}),
+            'limit_visibility_in_menu': ('django.db.models.fields.SmallIntegerField', [], {'default': 'None', 'null': 'True', 'db_index': 'True', 'blank': 'True'}),
+            'login_required': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'navigation_extenders': ('django.db.models.fields.CharField', [], {'db_index': 'True', 'max_length': '80', 'null': 'True', 'blank': 'True'}),
+            'parent': ('django.db.models.fields.related.ForeignKey', [], {'blank': 'True', 'related_name': "'children'", 'null': 'True', 'to': "orm['cms.Page']"}),
+            'placeholders': ('django.db.models.fields.related.ManyToManyField', [], {'to': "orm['cms.Placeholder']", 'symmetrical': 'False'}),
+            'publication_date': ('django.db.models.fields.DateTimeField', [], {'db_index': 'True', 'null': 'True', 'blank': 'True'}),
+            'publication_end_date': ('django.db.models.fields.DateTimeField', [], {'db_index': 'True', 'null': 'True', 'blank': 'True'}),
+            'published': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'publisher_is_draft': ('django.db.models.fields.BooleanField', [], {'default': 'True', 'db_index': 'True'}),
+            'publisher_public': ('django.db.models.fields.related.OneToOneField', [], {'related_name': "'publisher_draft'", 'unique': 'True', 'null': 'True', 'to': "orm['cms.Page']"}),
+            'publisher_state': ('django.db.models.fields.SmallIntegerField', [], {'default': '0', 'db_index': 'True'}),
+            'reverse_id': ('django.db.models.fields.CharField', [], {'db_index': 'True', 'max_length': '40', 'null': 'True', 'blank': 'True'}),
+            'rght': ('django.db.models.fields.PositiveIntegerField', [], {'db_index': 'True'}),
+            'site': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['sites.Site']"}),
+            'soft_root': ('django.db.models.fields.BooleanField', [], {'default': 'False', 'db_index': 'True'}),
+            'template': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            'tree_id': ('django.db.models.fields.PositiveIntegerField', [], {'db_index': 'True'})
+        },
+        'cms.placeholder': {
+            'Meta': {'object_name': 'Placeholder'},
+            'default_width': ('django.db.models.fields.PositiveSmallIntegerField', [], {'null': 'True'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'slot': ('django.db.models.fields.CharField', [], {'max_length': '50', 'db_index': 'True'})
+        },
+        u'cms_redirects.cmsredirect': {
+            'Meta': {'ordering': "('old_path',)", 'unique_together': "(('site', 'old_path_hash'),)", 'object_name': 'CMSRedirect'},
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'new_path': ('django.db.models.fields.CharField', [], {'max_length': '2000', 'blank': 'True'}),
+            'old_path': ('django.db.models.fields.CharField', [], {'max_length': '2000'}),
+            'old_path_hash': ('django.db.models.fields.BigIntegerField', [], {}),
+            'page': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['cms.Page']", 'null': 'True', 'blank': 'True'}),
+            'query_handling': ('django.db.models.fields.CharField', [], {'default': "'keep'", 'max_length': '10'}),
+            'response_code': ('django.db.models.fields.CharField', [], {'default': "'301'", 'max_length': '3'}),
+            'revision': ('django.db.models.fields.BigIntegerField', [], {'default': '0', 'db_index': 'True'}),
+            'site': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['sites.Site']"}),
+            'updated_at': ('django.db.models.fields.DateTimeField', [], {'auto_now': 'True', 'db_index': 'True', 'blank': 'True'}),
+            'valid_from': ('django.db.models.fields.DateTimeField', [], {'null': 'True', 'blank': 'True'}),
+            'valid_until': ('django.db.models.fields.DateTimeField', [], {'null': 'True', 'blank': 'True'})
+        },
+        u'cms_redirects.cmsredirectrevision': {
+            'Meta': {'object_name': 'CMSRedirectRevision'},
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'value': ('django.db.models.fields.BigIntegerField', [], {'default': '0'})
+        },
+        u'cms_redirects.cmsredirecttombstone': {
+            'Meta': {'object_name': 'CMSRedirectTombstone'},
+            'deleted_at': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now', 'db_index': 'True'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'redirect_id': ('django.db.models.fields.IntegerField', [], {}),
+            'revision': ('django.db.models.fields.BigIntegerField', [], {'default': '0', 'db_index': 'True'}),
+            'site': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['sites.Site']"})
+        },
+        u'sites.site': {
+            'Meta': {'ordering': "('domain',)", 'object_name': 'Site', 'db_table': "'django_site'"},
+            'domain': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '50'})
+        }
+    }
+
+    complete_apps = ['cms_redirects']
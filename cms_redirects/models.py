@@ -1,10 +1,16 @@
 """Models for cms redirects."""
-from django.db import models
+from django.db import connections, models, router, transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
 from django.contrib.sites.models import Site
 from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 from cms.models.fields import PageField
 
+from cms_redirects.utils import mark_recent_write, path_hash
+
 
 RESPONSE_CODES = (
     ('301', '301'),
@@ -16,6 +22,18 @@ DEFAULT_REDIRECT_RESPONSE_CODE = getattr(
     settings, 'DEFAULT_REDIRECT_RESPONSE_CODE', '301')
 
 
+QUERY_KEEP = 'keep'
+QUERY_DROP = 'drop'
+QUERY_UNMATCHED = 'unmatched'
+
+QUERY_HANDLING_CHOICES = (
+    (QUERY_KEEP, _('Pass the query string on')),
+    (QUERY_DROP, _('Drop the query string')),
+    (QUERY_UNMATCHED, _('Pass on parameters not matched or set'
+                        ' by the redirect')),
+)
+
+
 class CMSRedirect(models.Model):
     """Model for information about a redirect"""
     page = PageField(
@@ -27,18 +45,20 @@ class CMSRedirect(models.Model):
     site = models.ForeignKey(Site)
     old_path = models.CharField(
         verbose_name=_('redirect from'),
-        max_length=200,
-        db_index=True,
+        max_length=2000,
         help_text=_("This should be an absolute path, excluding the"
-                    " domain name. Example: '/events/search/'.")
+                    " domain name. Example: '/events/search/'. Add query"
+                    " parameters to only redirect requests that have them."
+                    " Example: '/index.php?page=123'.")
     )
     new_path = models.CharField(
         verbose_name=_('redirect to'),
-        max_length=200,
+        max_length=2000,
         blank=True,
         help_text=_("This can be either an absolute path (as above) or a"
                     " full URL starting with 'http://'.")
     )
+    old_path_hash = models.BigIntegerField(editable=False)
     response_code = models.CharField(
         verbose_name=_('response code'),
         max_length=3,
@@ -48,6 +68,37 @@ class CMSRedirect(models.Model):
                     " is specified. If no destination is specified"
                     " the response code will be 410.")
     )
+    query_handling = models.CharField(
+        verbose_name=_('query string'),
+        max_length=10,
+        choices=QUERY_HANDLING_CHOICES,
+        default=QUERY_KEEP,
+        help_text=_("What to do with the query string of the request."
+                    " Parameters in the destination always take priority.")
+    )
+    valid_from = models.DateTimeField(
+        verbose_name=_('active from'),
+        blank=True,
+        null=True,
+        help_text=_("Leave empty to redirect straight away.")
+    )
+    valid_until = models.DateTimeField(
+        verbose_name=_('active until'),
+        blank=True,
+        null=True,
+        help_text=_("Leave empty to keep redirecting indefinitely.")
+    )
+    updated_at = models.DateTimeField(
+        verbose_name=_('updated at'),
+        auto_now=True,
+        db_index=True
+    )
+    revision = models.BigIntegerField(
+        verbose_name=_('revision'),
+        default=0,
+        db_index=True,
+        editable=False
+    )
     
     def page_site(self):
         """If this redirects to a page, return the name of the site."""
@@ -62,13 +113,121 @@ class CMSRedirect(models.Model):
             return self.response_code
         return u'410'
     actual_response_code.short_description = "Response Code"
+
+    def is_active(self, now=None):
+        """Returns whether the redirect applies at the given time."""
+        if now is None:
+            now = timezone.now()
+        if self.valid_from and now < self.valid_from:
+            return False
+        if self.valid_until and now >= self.valid_until:
+            return False
+        return True
+
+    def clean_schedule(self):
+        """Check the redirect ends after it starts."""
+        if (self.valid_from and self.valid_until and
+                self.valid_until <= self.valid_from):
+            raise ValidationError(
+                _("A redirect has to end after it starts."))
+
+    def clean(self):
+        """Check the schedule and that no other redirect uses the path."""
+        self.clean_schedule()
+        if not self.old_path or not self.site_id:
+            return
+        duplicates = CMSRedirect.objects.filter(
+            site=self.site_id,
+            old_path_hash=path_hash(self.old_path)
+        )
+        if self.pk:
+            duplicates = duplicates.exclude(pk=self.pk)
+        if duplicates.exists():
+            raise ValidationError(
+                _("A redirect from this path already exists for this site."))
+
+    def save(self, *args, **kwargs):
+        """Keep the lookup hash in step with the path, and take a revision
+        in the same transaction as the write."""
+        using = kwargs.get('using') or router.db_for_write(
+            CMSRedirect, instance=self)
+        if not transaction.is_managed(using=using):
+            with transaction.commit_on_success(using=using):
+                return self.save(*args, **kwargs)
+        self.old_path_hash = path_hash(self.old_path)
+        self.revision = next_revision(using) or self.revision
+        super(CMSRedirect, self).save(*args, **kwargs)
     
     class Meta:
         verbose_name = _('CMS Redirect')
         verbose_name_plural = _('CMS Redirects')
-        unique_together=(('site', 'old_path'),)
+        unique_together=(('site', 'old_path_hash'),)
         ordering = ('old_path',)
     
     def __unicode__(self):
         """Unicode representation of this redirect."""
         return "%s ---> %s" % (self.old_path, self.new_path)
+
+
+class CMSRedirectTombstone(models.Model):
+    """Record of a deleted redirect, so redirect indexes can drop it."""
+    site = models.ForeignKey(Site)
+    redirect_id = models.IntegerField()
+    deleted_at = models.DateTimeField(default=timezone.now, db_index=True)
+    revision = models.BigIntegerField(default=0, db_index=True)
+
+    class Meta:
+        verbose_name = _('deleted CMS Redirect')
+        verbose_name_plural = _('deleted CMS Redirects')
+
+    def __unicode__(self):
+        """Unicode representation of this tombstone."""
+        return u"%s deleted at %s" % (self.redirect_id, self.deleted_at)
+
+
+class CMSRedirectRevision(models.Model):
+    """Counter of the changes made to redirects, in a single row.
+
+    Not used on PostgreSQL, where rows are stamped with the id of the
+    transaction writing them instead.
+    """
+    value = models.BigIntegerField(default=0)
+
+
+def next_revision(using):
+    """Take the revision for a change to the redirects, inside the
+    transaction making it.
+
+    The counter row stays locked until the transaction ends, so changes
+    are committed in order of revision. Returns None on PostgreSQL, where
+    triggers added by the migrations stamp the rows.
+    """
+    if connections[using].vendor == 'postgresql':
+        return None
+    counter = CMSRedirectRevision.objects.using(using).filter(pk=1)
+    if not counter.update(value=F('value') + 1):
+        CMSRedirectRevision.objects.using(using).create(pk=1, value=1)
+    return counter.values_list('value', flat=True)[0]
+
+
+def record_redirect_deletion(sender, instance, using, **kwargs):
+    """Leave a tombstone for a deleted redirect.
+
+    On PostgreSQL a trigger added by the migrations does this instead, so
+    deletions made outside of Django are recorded too.
+    """
+    if connections[using].vendor == 'postgresql':
+        return
+    CMSRedirectTombstone.objects.using(using).create(
+        site_id=instance.site_id, redirect_id=instance.pk,
+        revision=next_revision(using))
+
+post_delete.connect(record_redirect_deletion, sender=CMSRedirect)
+
+
+def record_redirect_write(sender, instance, **kwargs):
+    """Note that the redirects of the site have just changed."""
+    mark_recent_write(instance.site_id)
+
+post_save.connect(record_redirect_write, sender=CMSRedirect)
+post_delete.connect(record_redirect_write, sender=CMSRedirect)
@@ -0,0 +1,209 @@
+"""Replaying access logs through the redirect middleware."""
+import multiprocessing
+import re
+import threading
+from array import array
+from bisect import bisect_left
+from timeit import default_timer
+
+from django import http
+from django.db import connections
+from django.test.client import RequestFactory
+
+from cms_redirects.middleware import RedirectMiddleware
+from cms_redirects.utils import close_connections
+
+
+# The start of a line in the combined (or common) log format.
+LOG_LINE = re.compile(
+    r'\S+ \S+ \S+ \[[^\]]*\] "(?P<method>[A-Z]+) (?P<path>\S+)[^"]*"'
+    r' (?P<status>\d{3}) ')
+
+# Upper bounds of the latency histogram buckets, in milliseconds.
+BUCKETS = (0.05, 0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+def parse_log(lines, statuses=None, methods=('GET', 'HEAD')):
+    """Yield the paths requested in an access log.
+
+    Only requests with one of the ``methods`` are kept, and only those
+    answered with one of the ``statuses`` if given.
+    """
+    for line in lines:
+        match = LOG_LINE.match(line)
+        if match is None:
+            continue
+        if match.group('method') not in methods:
+            continue
+        if statuses and int(match.group('status')) not in statuses:
+            continue
+        yield match.group('path')
+
+
+class ReplayStats(object):
+    """What happened to the requests replayed."""
+    def __init__(self):
+        self.latencies = array('d')
+        self.queries = 0
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.codes = {}
+        self.elapsed = 0.0
+
+    def __len__(self):
+        return len(self.latencies)
+
+    def record(self, latency, queries, response):
+        """Record a request answered in latency seconds."""
+        self.latencies.append(latency)
+        self.queries += queries
+        if response is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.codes[response.status_code] = (
+                self.codes.get(response.status_code, 0) + 1)
+
+    def merge(self, other):
+        """Add the requests recorded by another."""
+        self.latencies.extend(other.latencies)
+        self.queries += other.queries
+        self.hits += other.hits
+        self.misses += other.misses
+        self.errors += other.errors
+        for code, count in other.codes.iteritems():
+            self.codes[code] = self.codes.get(code, 0) + count
+
+    def percentile(self, fraction):
+        """Returns the latency a fraction of requests took at most, in ms."""
+        if not self.latencies:
+            return 0.0
+        latencies = sorted(self.latencies)
+        position = min(len(latencies) - 1, int(fraction * len(latencies)))
+        return latencies[position] * 1000
+
+    def histogram(self):
+        """Returns the number of requests in each latency bucket."""
+        counts = [0] * (len(BUCKETS) + 1)
+        for latency in self.latencies:
+            counts[bisect_left(BUCKETS, latency * 1000)] += 1
+        return counts
+
+    def report(self):
+        """Returns the lines of a summary."""
+        total = len(self)
+        lines = [
+            'Requests: %s in %.2fs, %.0f per second' % (
+                total, self.elapsed,
+                total / self.elapsed if self.elapsed else 0),
+            'Redirected: %s, not found: %s, errors: %s' % (
+                self.hits, self.misses, self.errors),
+            'Response codes: %s' % ', '.join(
+                '%s: %s' % item for item in sorted(self.codes.items())),
+            'Queries per request: %.3f' % (
+                float(self.queries) / total if total else 0),
+            'Latency ms: p50 %.3f, p90 %.3f, p99 %.3f, max %.3f' % (
+                self.percentile(0.5), self.percentile(0.9),
+                self.percentile(0.99), self.percentile(1)),
+            'Latency histogram:',
+        ]
+        lower = 0
+        for upper, count in zip(BUCKETS + (None,), self.histogram()):
+            if upper is None:
+                label = '> %s ms' % lower
+            else:
+                label = '%s-%s ms' % (lower, upper)
+                lower = upper
+            share = float(count) / total if total else 0
+            lines.append('  %-14s %8s %6.2f%% %s' % (
+                label, count, share * 100, '#' * int(share * 50)))
+        return lines
+
+
+def replay(paths, host=None):
+    """Replay requests for paths through the middleware in this thread.
+
+    Each request is handed to ``process_exception`` as a 404, as it would
+    be after no view was found. Queries are counted on every database
+    connection of the thread.
+    """
+    stats = ReplayStats()
+    middleware = RedirectMiddleware()
+    factory = RequestFactory()
+    extra = {'HTTP_HOST': host} if host else {}
+    debug = [(conn, conn.use_debug_cursor) for conn in connections.all()]
+    for conn, previous in debug:
+        conn.use_debug_cursor = True
+    try:
+        for path in paths:
+            request = factory.get(path, **extra)
+            before = sum(len(conn.queries) for conn, previous in debug)
+            start = default_timer()
+            try:
+                response = middleware.process_exception(
+                    request, http.Http404())
+            except Exception:
+                stats.errors += 1
+                continue
+            latency = default_timer() - start
+            queries = sum(len(conn.queries) for conn, previous in debug)
+            stats.record(latency, queries - before, response)
+            if queries > 10000:
+                for conn, previous in debug:
+                    del conn.queries[:]
+    finally:
+        for conn, previous in debug:
+            conn.use_debug_cursor = previous
+    return stats
+
+
+def replay_share(args):
+    """Replay a share of the paths in a worker process."""
+    return replay(*args)
+
+
+def run(paths, threads=1, processes=1, host=None):
+    """Replay requests for paths, spread over threads or processes.
+
+    Paths are dealt out to the workers in turn. Processes are forked, so
+    they start with the indexes already loaded by this one. Threads and
+    processes can not be combined.
+    """
+    if threads > 1 and processes > 1:
+        raise ValueError('Use either threads or processes, not both')
+    paths = list(paths)
+    start = default_timer()
+    if processes > 1:
+        pool = multiprocessing.Pool(processes, initializer=close_connections)
+        try:
+            results = pool.map(replay_share, [
+                (paths[number::processes], host)
+                for number in range(processes)])
+        finally:
+            pool.close()
+            pool.join()
+    elif threads > 1:
+        results = [None] * threads
+
+        def work(number):
+            """Replay a share of the paths."""
+            try:
+                results[number] = replay(paths[number::threads], host)
+            finally:
+                close_connections()
+
+        workers = [threading.Thread(target=work, args=(number,))
+                   for number in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        results = [result for result in results if result is not None]
+    else:
+        results = [replay(paths, host)]
+    stats = ReplayStats()
+    for result in results:
+        stats.merge(result)
+    stats.elapsed = default_timer() - start
+    return stats
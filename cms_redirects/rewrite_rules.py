@@ -0,0 +1,349 @@
+"""Reading redirects from nginx and Apache configuration files."""
+import re
+from collections import namedtuple
+
+from cms_redirects.models import QUERY_DROP, QUERY_KEEP
+
+
+EXACT = 'exact'
+PREFIX = 'prefix'
+REGEX = 'regex'
+
+TOKEN = re.compile(r'''"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*'|[;{}]|#.*|[^\s;{}"'#]+''')
+METACHARACTERS = '.^$*+?{}[]|()'
+ARGS_SUFFIXES = ('$is_args$args', '?$args')
+
+MAP_VARIABLES = ('$uri', '$request_uri', '$document_uri')
+
+# Directives found in Apache configuration files and .htaccess files,
+# leaving out those nginx has as well, such as allow and deny.
+APACHE_DIRECTIVES = ('redirect', 'redirectmatch', 'redirectpermanent',
+                     'redirecttemp', 'rewriterule', 'rewritecond',
+                     'rewriteengine', 'rewritebase', 'rewriteoptions',
+                     'options', 'errordocument', 'directoryindex',
+                     'addtype', 'addhandler', 'adddefaultcharset',
+                     'addoutputfilterbytype', 'authtype', 'authname',
+                     'authuserfile', 'defaulttype', 'expiresactive',
+                     'expiresbytype', 'expiresdefault', 'fileetag',
+                     'header', 'indexignore', 'indexoptions', 'order',
+                     'php_flag', 'php_value', 'require', 'satisfy',
+                     'setenv', 'setenvif', 'setoutputfilter')
+APACHE_STATUSES = {'permanent': 301, 'temp': 302, 'seeother': 303,
+                   'gone': 410}
+
+# Rules are reported with the line they start on, how they match and
+# either what they redirect or why they can not be imported.
+Rule = namedtuple('Rule', 'line kind old_path new_path response_code'
+                          ' query_handling problem')
+
+
+def tokenize(line):
+    """Split a line of configuration into words, dropping comments."""
+    words = []
+    for word in TOKEN.findall(line):
+        if word.startswith('#'):
+            break
+        if word[0] in '"\'' and len(word) > 1 and word[-1] == word[0]:
+            word = word[1:-1]
+        words.append(word)
+    return words
+
+
+def literal_path(pattern):
+    """Return the one path a regular expression matches, or None.
+
+    Only patterns anchored at both ends and made of literal characters
+    qualify. An optional leading slash, as in ``.htaccess`` files, and an
+    optional trailing slash are allowed, the middleware takes care of the
+    trailing slash. An unescaped ``.`` is taken to mean a dot.
+    """
+    if len(pattern) < 2 or pattern[0] != '^' or pattern[-1] != '$':
+        return None
+    body = pattern[1:-1]
+    if body.startswith('/?'):
+        body = body[2:]
+    if body.endswith('/?'):
+        body = body[:-2]
+    path = []
+    escaped = False
+    for character in body:
+        if escaped:
+            if character.isalnum():
+                return None
+            path.append(character)
+            escaped = False
+        elif character == '\\':
+            escaped = True
+        elif character in METACHARACTERS and character != '.':
+            return None
+        else:
+            path.append(character)
+    if escaped:
+        return None
+    path = ''.join(path)
+    if not path.startswith('/'):
+        path = '/' + path
+    return path
+
+
+def response_code(status):
+    """Return the redirect response code closest to an HTTP status."""
+    status = int(status)
+    if status in (301, 308):
+        return '301'
+    if status in (302, 303, 307):
+        return '302'
+    if status == 410:
+        return '410'
+    raise ValueError('Not a redirect status: %s' % status)
+
+
+def make_rule(line, kind, old_path, new_path, status, text,
+              query_handling=QUERY_KEEP):
+    """Make a rule, or the reason it can not be imported."""
+    if new_path and old_path:
+        new_path = new_path.replace('$request_uri', old_path).replace(
+            '$uri', old_path)
+        for suffix in ARGS_SUFFIXES:
+            if new_path.endswith(suffix):
+                new_path = new_path[:-len(suffix)]
+                break
+        if new_path.endswith('?'):
+            new_path = new_path[:-1]
+            query_handling = QUERY_DROP
+    if old_path is None:
+        return unsupported(line, kind, 'pattern is not a literal path', text)
+    if new_path and ('$' in new_path or '%{' in new_path):
+        return unsupported(line, kind, 'destination uses variables', text)
+    try:
+        code = response_code(status)
+    except ValueError, error:
+        return unsupported(line, kind, str(error), text)
+    if code == '410':
+        new_path = ''
+    elif not new_path:
+        return unsupported(line, kind, 'no destination', text)
+    return Rule(line, kind, old_path, new_path, code, query_handling, None)
+
+
+def make_prefix_rule(line, old_path, new_path, status, text, as_exact):
+    """Make a rule matching a path and every path below it.
+
+    Those can only be imported as a redirect of the path itself, and only
+    if ``as_exact`` is set.
+    """
+    if not as_exact:
+        return unsupported(line, PREFIX, 'matches every path below', text)
+    return make_rule(line, PREFIX, old_path, new_path, status, text)
+
+
+def unsupported(line, kind, problem, text):
+    """Make a rule that can not be imported."""
+    return Rule(line, kind, None, None, None, None,
+                '%s: %s' % (problem, text.strip()))
+
+
+def guess_format(lines):
+    """Return 'apache' if any line starts with an Apache directive or
+    section, or if there are no nginx statements or blocks at all, and
+    'nginx' otherwise."""
+    nginx = False
+    for line in lines:
+        words = tokenize(line)
+        if not words:
+            continue
+        if words[0].lower() in APACHE_DIRECTIVES or words[0][0] == '<':
+            return 'apache'
+        if ';' in words or '{' in words:
+            nginx = True
+    if nginx:
+        return 'nginx'
+    return 'apache'
+
+
+def join_lines(lines):
+    """Yield the number and text of lines, joining continued lines."""
+    text, start = '', None
+    for number, line in enumerate(lines, 1):
+        if start is None:
+            start = number
+        if line.rstrip().endswith('\\'):
+            text += line.rstrip()[:-1] + ' '
+            continue
+        yield start, text + line
+        text, start = '', None
+    if start is not None:
+        yield start, text
+
+
+def parse_apache(lines, prefix_as_exact=False):
+    """Yield the rules of Apache ``Redirect``, ``RedirectMatch`` and
+    ``RewriteRule`` directives, a line at a time."""
+    conditions = False
+    for number, text in join_lines(lines):
+        words = tokenize(text)
+        if not words:
+            continue
+        directive, args = words[0].lower(), words[1:]
+        if directive == 'rewritecond':
+            conditions = True
+        elif directive == 'rewriterule':
+            yield parse_rewrite_rule(number, args, conditions, text)
+            conditions = False
+        elif directive in ('redirect', 'redirectmatch', 'redirectpermanent',
+                           'redirecttemp'):
+            yield parse_apache_redirect(number, directive, args, text,
+                                        prefix_as_exact)
+
+
+def parse_apache_redirect(number, directive, args, text, prefix_as_exact):
+    """Parse the arguments of a ``Redirect`` or ``RedirectMatch``."""
+    kind = REGEX if directive == 'redirectmatch' else PREFIX
+    status = {'redirectpermanent': 301, 'redirecttemp': 302}.get(directive)
+    if status is None:
+        status = 302
+        if args and (args[0].lower() in APACHE_STATUSES or
+                     args[0].isdigit()):
+            status = APACHE_STATUSES.get(args[0].lower(), args[0])
+            args = args[1:]
+    if not args:
+        return unsupported(number, kind, 'no source', text)
+    new_path = args[1] if len(args) > 1 else ''
+    if kind == REGEX:
+        return make_rule(number, kind, literal_path(args[0]), new_path,
+                         status, text)
+    return make_prefix_rule(number, args[0], new_path, status, text,
+                            prefix_as_exact)
+
+
+def parse_rewrite_rule(number, args, conditions, text):
+    """Parse the arguments of a ``RewriteRule``."""
+    if len(args) < 2:
+        return unsupported(number, REGEX, 'no substitution', text)
+    pattern, substitution = args[0], args[1]
+    flags = []
+    if len(args) > 2:
+        flags = [f.strip().lower() for f in args[2].strip('[]').split(',')]
+    query_handling = QUERY_KEEP
+    if 'qsd' in flags:
+        query_handling = QUERY_DROP
+    status = None
+    for flag in flags:
+        if flag in ('r', 'redirect'):
+            status = 302
+        elif flag.startswith('r=') or flag.startswith('redirect='):
+            status = flag.partition('=')[2]
+            status = APACHE_STATUSES.get(status, status)
+        elif flag in ('g', 'gone'):
+            status, substitution = 410, ''
+    if status is None:
+        if not re.match(r'https?://', substitution):
+            return unsupported(number, REGEX, 'not a redirect', text)
+        status = 302
+    if conditions:
+        return unsupported(number, REGEX, 'has conditions', text)
+    if substitution == '-':
+        substitution = ''
+    return make_rule(number, REGEX, literal_path(pattern), substitution,
+                     status, text, query_handling)
+
+
+def parse_nginx(lines, default_status=301, prefix_as_exact=False):
+    """Yield the rules of nginx ``rewrite``, ``return`` and ``map``
+    directives, a statement at a time.
+
+    ``return`` is understood in exact and prefix ``location`` blocks, and
+    ``map`` entries are taken to redirect with ``default_status``.
+    """
+    blocks = []
+    words = []
+    start = None
+    for number, line in enumerate(lines, 1):
+        for word in tokenize(line):
+            if start is None:
+                start = number
+            if word == '{':
+                blocks.append(words)
+                words, start = [], None
+            elif word == '}':
+                if blocks:
+                    blocks.pop()
+                words, start = [], None
+            elif word == ';':
+                if words:
+                    rule = parse_nginx_statement(
+                        start, words, blocks, default_status, prefix_as_exact)
+                    if rule is not None:
+                        yield rule
+                words, start = [], None
+            else:
+                words.append(word)
+
+
+def parse_nginx_statement(number, words, blocks, default_status,
+                          prefix_as_exact):
+    """Parse one nginx statement given the blocks it is in."""
+    text = ' '.join(words)
+    block = blocks[-1] if blocks else []
+    if block and block[0] == 'map':
+        if len(block) < 2 or block[1] not in MAP_VARIABLES:
+            return None
+        source = words[0]
+        if source in ('default', 'hostnames', 'include', 'volatile'):
+            return None
+        if source.startswith('~'):
+            return make_rule(number, REGEX, literal_path(source.lstrip('~*')),
+                             words[-1], default_status, text)
+        return make_rule(number, EXACT, source, words[-1],
+                         default_status, text)
+    directive = words[0]
+    if directive in ('rewrite', 'return') and any(
+            b and b[0] == 'if' for b in blocks):
+        return unsupported(number, REGEX, 'has conditions', text)
+    if directive == 'rewrite' and len(words) >= 3:
+        flag = words[3] if len(words) > 3 else None
+        status = {'permanent': 301, 'redirect': 302}.get(flag)
+        if status is None:
+            if not re.match(r'https?://', words[2]) or flag in ('last',
+                                                                 'break'):
+                return unsupported(number, REGEX, 'not a redirect', text)
+            status = 302
+        return make_rule(number, REGEX, literal_path(words[1]), words[2],
+                         status, text)
+    if directive == 'return' and len(words) >= 2:
+        if words[1].isdigit():
+            status, new_path = words[1], words[2] if len(words) > 2 else ''
+        else:
+            status, new_path = 302, words[1]
+        if not (300 <= int(status) < 400 or int(status) == 410):
+            return None
+        locations = [b for b in blocks if b and b[0] == 'location']
+        if not locations:
+            return unsupported(number, PREFIX, 'outside a location', text)
+        location = locations[-1][1:]
+        if len(location) == 2 and location[0] == '=':
+            return make_rule(number, EXACT, location[1], new_path, status,
+                             text)
+        if len(location) == 2 and location[0] in ('~', '~*'):
+            return make_rule(number, REGEX, literal_path(location[1]),
+                             new_path, status, text)
+        return make_prefix_rule(number, location[-1], new_path, status, text,
+                                prefix_as_exact)
+    return None
+
+
+def parse(lines, format=None, default_status=301, prefix_as_exact=False):
+    """Yield the rules in the lines of a configuration file.
+
+    ``format`` is 'nginx' or 'apache', and is guessed if not given, in
+    which case ``lines`` has to be a list or a file that can be read again.
+    Rules matching every path below a prefix are imported as redirects of
+    the prefix itself if ``prefix_as_exact`` is set.
+    """
+    if format is None:
+        format = guess_format(lines)
+        if hasattr(lines, 'seek'):
+            lines.seek(0)
+    if format == 'apache':
+        return parse_apache(lines, prefix_as_exact)
+    return parse_nginx(lines, default_status, prefix_as_exact)
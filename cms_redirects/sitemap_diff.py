@@ -0,0 +1,131 @@
+"""Matching the urls of an old sitemap to the urls of a new one."""
+import re
+from urlparse import urlparse
+from xml.etree.cElementTree import iterparse
+
+
+EXACT = 'exact'
+FUZZY = 'fuzzy'
+
+EXTENSIONS = re.compile(r'\.(html?|php|aspx?|jsp|cfm)$')
+NON_WORD = re.compile(r'[^a-z0-9]+')
+
+
+def iter_sitemap(source):
+    """Yield the paths of the urls in a sitemap.
+
+    The file is parsed as a stream, dropping every url once it is read, so
+    memory use does not grow with the size of the sitemap. The sitemaps
+    listed in a sitemap index are not pages, and are not followed either.
+    """
+    root = None
+    parent = None
+    for event, element in iterparse(source, events=('start', 'end')):
+        if root is None:
+            root = element
+        tag = element.tag.rpartition('}')[2]
+        if event == 'start':
+            if tag in ('url', 'sitemap'):
+                parent = tag
+            continue
+        if tag == 'loc' and parent == 'url' and element.text:
+            yield get_path(element.text.strip())
+        elif tag in ('url', 'sitemap'):
+            root.clear()
+            parent = None
+
+
+def get_path(url):
+    """Return the path and query string of a url."""
+    parsed = urlparse(url)
+    path = parsed.path or '/'
+    if parsed.query:
+        return '%s?%s' % (path, parsed.query)
+    return path
+
+
+def get_slug(path):
+    """Return the last segment of a path, lowercased and without extension."""
+    segments = [s for s in path.partition('?')[0].split('/') if s]
+    if not segments:
+        return ''
+    return EXTENSIONS.sub('', segments[-1].lower())
+
+
+def get_trigrams(text):
+    """Return the set of three character sequences in the words of text."""
+    text = ' %s ' % NON_WORD.sub(' ', text.lower()).strip()
+    return set(text[i:i + 3] for i in range(len(text) - 2))
+
+
+def similarity(a, b):
+    """Return the dice coefficient of two sets of trigrams."""
+    if not a or not b:
+        return 0.0
+    return 2.0 * len(a & b) / (len(a) + len(b))
+
+
+class SitemapMatcher(object):
+    """Finds the new url for an url that is gone from a sitemap.
+
+    Urls are matched by the last segment of their path, the slug. Urls
+    whose slug is not found are matched to the url with the most similar
+    slug, looked up in an index of the trigrams of the slugs, as long as
+    that is at least ``threshold`` similar.
+    """
+    def __init__(self, threshold=0.5):
+        self.threshold = threshold
+        self.paths = set()
+        self.slugs = {}
+        self.names = []
+        self.sizes = []
+        self.postings = {}
+
+    def add(self, path):
+        """Add the path of an url in the new sitemap."""
+        if path in self.paths:
+            return
+        self.paths.add(path)
+        slug = get_slug(path)
+        self.slugs.setdefault(slug, []).append(path)
+        trigrams = get_trigrams(slug)
+        number = len(self.names)
+        self.names.append(path)
+        self.sizes.append(len(trigrams))
+        for trigram in trigrams:
+            self.postings.setdefault(trigram, []).append(number)
+
+    def match(self, path):
+        """Match the path of an url in the old sitemap.
+
+        Returns the new path and whether it was an exact or fuzzy match,
+        or None if the url is still there or nothing matches.
+        """
+        if path in self.paths:
+            return None
+        slug = get_slug(path)
+        candidates = self.slugs.get(slug)
+        if candidates:
+            return self.closest(path, candidates), EXACT
+        trigrams = get_trigrams(slug)
+        shared = {}
+        for trigram in trigrams:
+            for number in self.postings.get(trigram, ()):
+                shared[number] = shared.get(number, 0) + 1
+        best, best_score = None, self.threshold
+        for number, count in shared.iteritems():
+            score = 2.0 * count / (len(trigrams) + self.sizes[number])
+            if score > best_score or (score == best_score and
+                                      (best is None or number < best)):
+                best, best_score = number, score
+        if best is None:
+            return None
+        return self.names[best], FUZZY
+
+    def closest(self, path, candidates):
+        """Return the candidate whose whole path is most like path."""
+        if len(candidates) == 1:
+            return candidates[0]
+        trigrams = get_trigrams(path)
+        return max(candidates,
+                   key=lambda c: similarity(trigrams, get_trigrams(c)))
@@ -0,0 +1,54 @@
+"""Tests for the redirect admin."""
+from cms.api import create_page
+from cms_redirects.admin import CMSRedirectAdmin
+from cms_redirects.models import CMSRedirect
+from django.contrib import admin
+from django.test import TestCase, RequestFactory
+
+
+class CMSRedirectAdminTest(TestCase):
+    """Tests for the redirect admin."""
+    def setUp(self):
+        """A few quick things used by a lot of tests."""
+        self.model_admin = CMSRedirectAdmin(CMSRedirect, admin.site)
+        self.request = RequestFactory().get('/')
+
+    def create_redirects(self, count):
+        """Create redirects to pages."""
+        for number in range(count):
+            page = create_page(
+                title='Page %s' % number,
+                template='template_1.html',
+                language='en',
+                slug='page-%s' % number
+            )
+            CMSRedirect.objects.create(
+                site_id=1, old_path='/old/%s/' % number, page=page)
+
+    def test_queryset_fetches_related(self):
+        """Should list redirects with the same queries however many."""
+        self.create_redirects(3)
+        with self.assertNumQueries(2):
+            for redirect in self.model_admin.queryset(self.request):
+                self.model_admin.page_title(redirect)
+                redirect.page_site()
+                redirect.actual_response_code()
+                unicode(redirect.site)
+
+    def test_page_title(self):
+        """Should show the title of the destination page."""
+        self.create_redirects(1)
+        redirect = self.model_admin.queryset(self.request).get()
+        self.assertEqual(self.model_admin.page_title(redirect), 'Page 0')
+
+    def test_page_title_no_page(self):
+        """Should show nothing when redirecting to a path."""
+        redirect = CMSRedirect(new_path='/new/')
+        self.assertEqual(self.model_admin.page_title(redirect), '')
+
+    def test_count_exact(self):
+        """Should count small or filtered tables exactly."""
+        self.create_redirects(2)
+        queryset = self.model_admin.queryset(self.request)
+        self.assertEqual(queryset.count(), 2)
+        self.assertEqual(queryset.filter(old_path='/old/1/').count(), 1)
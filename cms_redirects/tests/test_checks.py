@@ -0,0 +1,107 @@
+"""Tests for redirect checks."""
+import csv
+import tempfile
+
+from cms.api import create_page
+from django.contrib.sites.models import Site
+from django.core.management import call_command
+from django.test import TestCase
+
+from cms_redirects import checks, index
+from cms_redirects.models import CMSRedirect
+
+
+class RedirectCheckerTest(TestCase):
+    """Tests for redirect checks."""
+    def setUp(self):
+        """Make a checker that works in the test thread."""
+        index.clear()
+        self.page = create_page(
+            title='A page somewhere',
+            template='template_1.html',
+            language='en',
+            slug='a-page-somewhere',
+            published=True,
+        )
+        self.checker = checks.RedirectChecker(
+            Site.objects.get_current(), workers=1)
+
+    def check(self):
+        """Check the redirects, returning statuses by old path."""
+        rows = self.checker.load()
+        return dict((result[0], result[2:])
+                    for result in self.checker.run(rows))
+
+    def test_page(self):
+        """Should find redirects to published pages ok."""
+        CMSRedirect.objects.create(
+            site_id=1, old_path='/old/', page=self.page)
+        self.assertEqual(self.check()['/old/'], (checks.OK, '200'))
+
+    def test_broken(self):
+        """Should find redirects to missing paths broken."""
+        CMSRedirect.objects.create(
+            site_id=1, old_path='/old/', new_path='/en/nowhere/')
+        self.assertEqual(self.check()['/old/'][0], checks.BROKEN)
+
+    def test_gone(self):
+        """Should find redirects without a destination ok."""
+        CMSRedirect.objects.create(site_id=1, old_path='/old/')
+        self.assertEqual(self.check()['/old/'], (checks.OK, 'gone'))
+
+    def test_chained(self):
+        """Should follow destinations that are redirected themselves."""
+        CMSRedirect.objects.create(
+            site_id=1, old_path='/old/', new_path='/older/')
+        CMSRedirect.objects.create(
+            site_id=1, old_path='/older/', page=self.page)
+        results = self.check()
+        self.assertEqual(results['/old/'][0], checks.CHAINED)
+        self.assertEqual(results['/older/'][0], checks.OK)
+
+    def test_loop(self):
+        """Should find redirects that end up where they started."""
+        CMSRedirect.objects.create(
+            site_id=1, old_path='/old/', new_path='/older/')
+        CMSRedirect.objects.create(
+            site_id=1, old_path='/older/', new_path='/old/')
+        results = self.check()
+        self.assertEqual(results['/old/'][0], checks.LOOP)
+        self.assertEqual(results['/older/'][0], checks.LOOP)
+
+    def test_external(self):
+        """Should not request other sites unless asked to."""
+        CMSRedirect.objects.create(
+            site_id=1, old_path='/old/', new_path='http://example.org/')
+        self.assertEqual(self.check()['/old/'], (checks.EXTERNAL, 'not checked'))
+
+    def test_processes(self):
+        """Should check redirects in worker processes just the same.
+
+        The workers open database connections of their own, which for
+        the in-memory test database are empty, so these redirects are
+        checked without one.
+        """
+        CMSRedirect.objects.create(site_id=1, old_path='/gone/')
+        CMSRedirect.objects.create(
+            site_id=1, old_path='/old/', new_path='/older/')
+        CMSRedirect.objects.create(
+            site_id=1, old_path='/older/', new_path='/old/')
+        CMSRedirect.objects.create(
+            site_id=1, old_path='/away/', new_path='http://example.org/')
+        expected = self.check()
+        self.checker = checks.RedirectChecker(
+            Site.objects.get_current(), workers=3)
+        self.assertEqual(self.check(), expected)
+        self.assertEqual(len(expected), 4)
+
+    def test_command(self):
+        """Should write the results to a csv file."""
+        CMSRedirect.objects.create(
+            site_id=1, old_path='/old/', page=self.page)
+        output = tempfile.NamedTemporaryFile()
+        call_command('check_redirects', workers=1, output=output.name)
+        rows = list(csv.reader(open(output.name)))
+        self.assertEqual(rows[0], ['Old Url', 'Destination', 'Status', 'Detail'])
+        self.assertEqual(rows[1][0], '/old/')
+        self.assertEqual(rows[1][2:], [checks.OK, '200'])
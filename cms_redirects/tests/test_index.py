@@ -0,0 +1,382 @@
+"""Tests for the redirect index."""
+import datetime
+import threading
+
+from cms.api import create_page
+from cms_redirects import index
+from cms_redirects.bulk import upsert_redirects
+from cms_redirects.index import (
+    RedirectIndex, database_redirects, lookup_database, write_snapshot)
+from cms_redirects.models import (
+    CMSRedirect, CMSRedirectTombstone, QUERY_DROP, QUERY_KEEP)
+from django.contrib.sites.models import Site
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import override_settings
+from django.utils import timezone
+
+
+class RedirectIndexTest(TestCase):
+    """Tests for the in-memory redirect index."""
+    def setUp(self):
+        """A few quick things used by a lot of tests."""
+        self.now = timezone.now()
+        self.hour = datetime.timedelta(hours=1)
+
+    def tearDown(self):
+        """Drop any snapshot, other tests would load it."""
+        cache.delete(index.SNAPSHOT_KEY % 1)
+
+    def get_index(self):
+        """Load an index for the default site."""
+        index = RedirectIndex(1)
+        index.load()
+        return index
+
+    def test_lookup_most_parameters(self):
+        """Should prefer the redirect matching the most parameters."""
+        CMSRedirect.objects.create(site_id=1, old_path='/a.php?x=1')
+        cms_redirect = CMSRedirect.objects.create(
+            site_id=1, old_path='/a.php?x=1&y=2'
+        )
+        result = self.get_index().lookup(['/a.php'], 'y=2&x=1')
+        self.assertEqual(result.pk, cms_redirect.pk)
+
+    def test_lookup_table(self):
+        """Should load plain redirects into the compact table."""
+        page_redirect = CMSRedirect.objects.create(
+            site_id=1, old_path='/a/', new_path='/new/', response_code='302'
+        )
+        CMSRedirect.objects.create(site_id=1, old_path='/b/', new_path='/new/')
+        index = self.get_index()
+        self.assertEqual(len(index.table), 2)
+        self.assertEqual(index.redirects, {})
+        result = index.lookup(['/a/'])
+        self.assertEqual(result.pk, page_redirect.pk)
+        self.assertEqual(result.old_path, '/a/')
+        self.assertEqual(result.new_path, '/new/')
+        self.assertEqual(result.response_code, '302')
+
+    def test_lookup_table_destinations(self):
+        """Should keep the destinations of the table in flat arrays."""
+        page = create_page('Here', 'template_1.html', 'en')
+        CMSRedirect.objects.create(
+            site_id=1, old_path='/a/', new_path=u'/n\xe9w/',
+            query_handling=QUERY_DROP)
+        CMSRedirect.objects.create(site_id=1, old_path='/b/', page=page)
+        index = self.get_index()
+        self.assertEqual(len(index.table), 2)
+        self.assertEqual(len(index.table.new_paths), 6)
+        result = index.lookup(['/a/'])
+        self.assertEqual(result.new_path, u'/n\xe9w/')
+        self.assertIsNone(result.page_id)
+        self.assertEqual(result.query_handling, QUERY_DROP)
+        result = index.lookup(['/b/'])
+        self.assertEqual(result.new_path, '')
+        self.assertEqual(result.page_id, page.pk)
+        self.assertEqual(result.query_handling, QUERY_KEEP)
+
+    def test_lookup_table_hash_collision(self):
+        """Should not return redirects whose path only shares the hash."""
+        CMSRedirect.objects.create(site_id=1, old_path='/a/')
+        CMSRedirect.objects.update(old_path='/b/')
+        self.assertIsNone(self.get_index().lookup(['/a/']))
+
+    @override_settings(REDIRECT_INDEX_CHUNK_SIZE=2)
+    def test_load_in_chunks(self):
+        """Should load every redirect, a chunk at a time."""
+        for number in range(5):
+            CMSRedirect.objects.create(
+                site_id=1, old_path='/%s/' % number)
+        index = self.get_index()
+        self.assertEqual(len(index.table), 5)
+        self.assertEqual(
+            list(index.table.hashes),
+            sorted(CMSRedirect.objects.values_list(
+                'old_path_hash', flat=True)))
+
+    def test_lookup_no_queries(self):
+        """Should not touch the database once loaded."""
+        CMSRedirect.objects.create(site_id=1, old_path='/a/')
+        index = self.get_index()
+        with self.assertNumQueries(0):
+            index.lookup(['/a/'])
+
+    def test_scheduled_redirect_starts(self):
+        """Should start redirecting once valid_from has passed."""
+        cms_redirect = CMSRedirect.objects.create(
+            site_id=1, old_path='/a/', valid_from=self.now + self.hour
+        )
+        index = self.get_index()
+        self.assertIsNone(index.lookup(['/a/']))
+        self.assertEqual(len(index.boundaries), 1)
+        index.update(self.now + 2 * self.hour)
+        self.assertEqual(index.lookup(['/a/']).pk, cms_redirect.pk)
+        self.assertEqual(index.boundaries, [])
+
+    def test_scheduled_redirect_stops(self):
+        """Should stop redirecting once valid_until has passed."""
+        cms_redirect = CMSRedirect.objects.create(
+            site_id=1,
+            old_path='/a/',
+            valid_from=self.now - self.hour,
+            valid_until=self.now + self.hour
+        )
+        index = self.get_index()
+        self.assertEqual(index.lookup(['/a/']).pk, cms_redirect.pk)
+        index.update(self.now + 2 * self.hour)
+        self.assertIsNone(index.lookup(['/a/']))
+        self.assertEqual(index.rules, {})
+
+    def test_lookup_does_not_wait_for_lock(self):
+        """Should not wait for a thread holding the lock, e.g. syncing."""
+        CMSRedirect.objects.create(
+            site_id=1, old_path='/a/', valid_until=self.now + self.hour)
+        index = self.get_index()
+        locked = threading.Event()
+        release = threading.Event()
+
+        def hold():
+            with index.lock:
+                locked.set()
+                release.wait(10)
+
+        holder = threading.Thread(target=hold)
+        holder.start()
+        try:
+            locked.wait(10)
+            results = []
+            lookup = threading.Thread(
+                target=lambda: results.append(index.lookup(['/a/'])))
+            lookup.start()
+            lookup.join(5)
+            self.assertFalse(lookup.is_alive())
+            self.assertIsNotNone(results[0])
+        finally:
+            release.set()
+            holder.join()
+
+    def test_lookup_skips_stopped_redirect_while_locked(self):
+        """Should not return a redirect due to stop if it can not update."""
+        CMSRedirect.objects.create(
+            site_id=1, old_path='/a/', valid_until=self.now + self.hour)
+        index = self.get_index()
+        index.boundaries[0] = (self.now - self.hour,) + index.boundaries[0][1:]
+        redirect = index.boundaries[0][2]
+        redirect.valid_until = self.now - self.hour
+        with index.lock:
+            result = []
+            lookup = threading.Thread(
+                target=lambda: result.append(index.lookup(['/a/'])))
+            lookup.start()
+            lookup.join(5)
+        self.assertEqual(result, [None])
+
+    def test_expired_redirect_ignored(self):
+        """Should leave redirects that have ended out of the index."""
+        CMSRedirect.objects.create(
+            site_id=1, old_path='/a/', valid_until=self.now - self.hour
+        )
+        index = self.get_index()
+        self.assertEqual(index.rules, {})
+        self.assertEqual(index.boundaries, [])
+
+    def test_sync_changed_redirect(self):
+        """Should pick up the new path of a changed redirect."""
+        cms_redirect = CMSRedirect.objects.create(site_id=1, old_path='/a/')
+        index = self.get_index()
+        cms_redirect.old_path = '/b/'
+        cms_redirect.save()
+        index.sync()
+        self.assertIsNone(index.lookup(['/a/']))
+        self.assertEqual(index.lookup(['/b/']).pk, cms_redirect.pk)
+
+    def test_sync_only_fetches_changes(self):
+        """Should only fetch redirects written since the last sync."""
+        unchanged = CMSRedirect.objects.create(site_id=1, old_path='/a/')
+        index = self.get_index()
+        changed = CMSRedirect.objects.create(site_id=1, old_path='/b/')
+        index.sync()
+        self.assertEqual(index.masked, set([changed.pk]))
+        index.sync()
+        self.assertEqual(index.masked, set([changed.pk]))
+        self.assertEqual(index.lookup(['/a/']).pk, unchanged.pk)
+        self.assertEqual(index.lookup(['/b/']).pk, changed.pk)
+
+    def test_sync_old_timestamp(self):
+        """Should fetch a redirect written long after its updated_at."""
+        index = self.get_index()
+        cms_redirect = CMSRedirect.objects.create(site_id=1, old_path='/a/')
+        CMSRedirect.objects.filter(pk=cms_redirect.pk).update(
+            updated_at=self.now - self.hour)
+        index.sync()
+        self.assertEqual(index.lookup(['/a/']).pk, cms_redirect.pk)
+
+    def test_sync_late_commit(self):
+        """Should fetch a redirect committed after a later revision was
+        synced, until the transaction writing it ends."""
+        redirects = self.get_index()
+        in_progress = redirects.revision + 10
+        pending_revision = index.pending_revision
+        index.pending_revision = lambda using: in_progress
+        try:
+            early = CMSRedirect.objects.create(site_id=1, old_path='/a/')
+            CMSRedirect.objects.filter(pk=early.pk).update(
+                revision=in_progress + 1)
+            redirects.sync()
+            late = CMSRedirect.objects.create(site_id=1, old_path='/b/')
+            CMSRedirect.objects.filter(pk=late.pk).update(
+                revision=in_progress)
+            redirects.sync()
+        finally:
+            index.pending_revision = pending_revision
+        self.assertEqual(redirects.lookup(['/a/']).pk, early.pk)
+        self.assertEqual(redirects.lookup(['/b/']).pk, late.pk)
+
+    def test_sync_bulk_upsert(self):
+        """Should fetch redirects created and updated in bulk."""
+        site = Site.objects.get(pk=1)
+        index = self.get_index()
+        upsert_redirects(site, [{'old_path': '/a/', 'new_path': '/b/'}])
+        index.sync()
+        self.assertEqual(index.lookup(['/a/']).new_path, '/b/')
+        upsert_redirects(site, [{'old_path': '/a/', 'new_path': '/c/'}])
+        index.sync()
+        self.assertEqual(index.lookup(['/a/']).new_path, '/c/')
+
+    def test_sync_deleted_redirect(self):
+        """Should drop deleted redirects."""
+        cms_redirect = CMSRedirect.objects.create(site_id=1, old_path='/a/')
+        index = self.get_index()
+        cms_redirect.delete()
+        self.assertEqual(CMSRedirectTombstone.objects.count(), 1)
+        index.sync()
+        self.assertIsNone(index.lookup(['/a/']))
+        self.assertEqual(index.redirects, {})
+
+    def test_sync_changed_schedule(self):
+        """Should not start a redirect on a schedule it no longer has."""
+        cms_redirect = CMSRedirect.objects.create(
+            site_id=1, old_path='/a/', valid_from=self.now + self.hour
+        )
+        index = self.get_index()
+        cms_redirect.valid_from = self.now + 3 * self.hour
+        cms_redirect.save()
+        index.sync()
+        index.update(self.now + 2 * self.hour)
+        self.assertIsNone(index.lookup(['/a/']))
+
+    @override_settings(REDIRECT_INDEX_SYNC_INTERVAL=60)
+    def test_get_index_waits_for_interval(self):
+        """Should not sync again within the interval."""
+        index.clear()
+        index.get_index(1)
+        with self.assertNumQueries(0):
+            index.get_index(1)
+
+    def test_lookup_database(self):
+        """Should find redirects from the path or the path and query."""
+        CMSRedirect.objects.create(site_id=1, old_path='/a/')
+        cms_redirect = CMSRedirect.objects.create(
+            site_id=1, old_path='/a/?y=2&x=1'
+        )
+        with self.assertNumQueries(1):
+            result = lookup_database(1, ['/a/', '/a'], 'x=1&y=2')
+        self.assertEqual(result.pk, cms_redirect.pk)
+        self.assertEqual(lookup_database(1, ['/a/'], 'x=1').old_path, '/a/')
+        self.assertIsNone(lookup_database(1, ['/b/']))
+
+    def test_lookup_database_inactive(self):
+        """Should not find redirects outside of their schedule."""
+        CMSRedirect.objects.create(
+            site_id=1, old_path='/a/', valid_until=self.now - self.hour
+        )
+        self.assertIsNone(lookup_database(1, ['/a/']))
+
+    def test_database_redirects_query_plan(self):
+        """Should look redirects up through the (site, hash) index."""
+        if connection.vendor != 'sqlite':
+            return
+        queryset = database_redirects(1, ['/some/path/', '/some/path'])
+        sql, params = queryset.query.sql_with_params()
+        cursor = connection.cursor()
+        cursor.execute('EXPLAIN QUERY PLAN %s' % sql, params)
+        plan = ' '.join(row[-1] for row in cursor.fetchall())
+        self.assertIn('site_id=? AND old_path_hash=?', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    @override_settings(REDIRECT_SNAPSHOT_CHUNK_SIZE=1)
+    def test_snapshot(self):
+        """Should load from the snapshot and sync what changed since."""
+        CMSRedirect.objects.create(site_id=1, old_path='/a/')
+        CMSRedirect.objects.create(site_id=1, old_path='/b/?x=1')
+        deleted = CMSRedirect.objects.create(site_id=1, old_path='/c/')
+        self.assertEqual(write_snapshot(1), 3)
+        deleted.delete()
+        CMSRedirect.objects.create(site_id=1, old_path='/d/')
+        with self.assertNumQueries(3):
+            redirects = self.get_index()
+        self.assertEqual(len(redirects.table), 2)
+        self.assertIsNotNone(redirects.lookup(['/a/']))
+        self.assertIsNotNone(redirects.lookup(['/b/'], 'x=1'))
+        self.assertIsNone(redirects.lookup(['/c/']))
+        self.assertIsNotNone(redirects.lookup(['/d/']))
+
+    @override_settings(REDIRECT_SNAPSHOT_CHUNK_SIZE=1)
+    def test_snapshot_missing_chunk(self):
+        """Should load from the database if part of the snapshot is gone."""
+        CMSRedirect.objects.create(site_id=1, old_path='/a/')
+        CMSRedirect.objects.create(site_id=1, old_path='/b/')
+        write_snapshot(1)
+        snapshot = cache.get(index.SNAPSHOT_KEY % 1)
+        cache.delete(index.SNAPSHOT_CHUNK_KEY % (1, snapshot['version'], 1))
+        redirects = self.get_index()
+        self.assertEqual(len(redirects.table), 2)
+        self.assertIsNotNone(redirects.lookup(['/a/']))
+        self.assertIsNotNone(redirects.lookup(['/b/']))
+
+    def test_prewarm(self):
+        """Should load the indexes of the configured sites."""
+        index.clear()
+        with override_settings(REDIRECT_PREWARM_SITES=[1]):
+            index.prewarm()
+        self.assertIn(1, index._indexes)
+        index.clear()
+
+    def test_warm_redirect_cache(self):
+        """Should store a snapshot of the current site."""
+        CMSRedirect.objects.create(site_id=1, old_path='/a/')
+        call_command('warm_redirect_cache', verbosity=0)
+        self.assertEqual(cache.get(index.SNAPSHOT_KEY % 1)['chunks'], 1)
+
+
+@override_settings(REDIRECT_READ_DATABASE='replica')
+class ReadDatabaseTest(TestCase):
+    """Tests for reading redirects from another database."""
+    multi_db = True
+
+    def test_load_and_sync(self):
+        """Should load and sync the index from the read database only."""
+        replicated = CMSRedirect.objects.using('replica').create(
+            site_id=1, old_path='/a/')
+        CMSRedirect.objects.create(site_id=1, old_path='/b/')
+        redirects = RedirectIndex(1)
+        with self.assertNumQueries(0):
+            with self.assertNumQueries(2, using='replica'):
+                redirects.load()
+        with self.assertNumQueries(0):
+            with self.assertNumQueries(3, using='replica'):
+                redirects.sync()
+        self.assertEqual(redirects.lookup(['/a/']).pk, replicated.pk)
+        self.assertIsNone(redirects.lookup(['/b/']))
+
+    def test_lookup_database(self):
+        """Should look redirects just saved up in the default database."""
+        CMSRedirect.objects.using('replica').create(site_id=1, old_path='/a/')
+        saved = CMSRedirect.objects.create(site_id=1, old_path='/b/')
+        with self.assertNumQueries(0, using='replica'):
+            with self.assertNumQueries(2):
+                self.assertEqual(lookup_database(1, ['/b/']).pk, saved.pk)
+                self.assertIsNone(lookup_database(1, ['/a/']))
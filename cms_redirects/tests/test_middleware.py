@@ -1,9 +1,11 @@
 """Tests for redirect middleware."""
 from urlparse import urlparse
 
-from cms_redirects.models import CMSRedirect
-from cms.api import create_page
+from cms_redirects import index
+from cms_redirects.models import CMSRedirect, QUERY_DROP, QUERY_UNMATCHED
+from cms.api import create_page, create_title
 from django import http
+from django.db import connection
 from django.test import TestCase, RequestFactory
 from django.test.utils import override_settings
 
@@ -16,6 +18,7 @@ class RedirectMiddlewareTest(TestCase):
         """A few quick things used by a lot of tests."""
         self.factory = RequestFactory()
         self.middleware = middleware.RedirectMiddleware()
+        index.clear()
 
     @override_settings(APPEND_SLASH=False)
     def test_get_possible_paths_append_slash_off(self):
@@ -58,6 +61,47 @@ class RedirectMiddlewareTest(TestCase):
         result = self.middleware.get_cms_redirect(['/some/path/'])
         self.assertEqual(result.pk, cms_redirect.pk)
 
+    def test_get_cms_redirect_latest(self):
+        """Should return the newest redirect when several paths match."""
+        CMSRedirect.objects.create(site_id=1, old_path='/some/path/')
+        cms_redirect = CMSRedirect.objects.create(
+            site_id=1, old_path='/some/path'
+        )
+        result = self.middleware.get_cms_redirect(
+            ['/some/path/', '/some/path'])
+        self.assertEqual(result.pk, cms_redirect.pk)
+
+    def test_get_cms_redirect_queryset_query_plan(self):
+        """Should load redirects along the (site, hash) index."""
+        if connection.vendor != 'sqlite':
+            return
+        queryset = index.RedirectIndex(1).queryset()
+        sql, params = queryset.query.sql_with_params()
+        cursor = connection.cursor()
+        cursor.execute('EXPLAIN QUERY PLAN %s' % sql, params)
+        plan = ' '.join(row[-1] for row in cursor.fetchall())
+        self.assertIn('site_id=?', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_get_cms_redirect_hash_collision(self):
+        """Should ignore redirects whose path only shares the hash."""
+        cms_redirect = CMSRedirect.objects.create(
+            site_id=1, old_path='/some/path/'
+        )
+        CMSRedirect.objects.filter(pk=cms_redirect.pk).update(
+            old_path='/another/path/')
+        result = self.middleware.get_cms_redirect(['/some/path/'])
+        self.assertIsNone(result)
+        result = index.lookup_database(1, ['/some/path/'])
+        self.assertIsNone(result)
+
+    def test_get_cms_redirect_long_path(self):
+        """Should find redirects for paths longer than 200 characters."""
+        path = '/tracking/%s/' % ('x' * 500)
+        cms_redirect = CMSRedirect.objects.create(site_id=1, old_path=path)
+        result = self.middleware.get_cms_redirect([path])
+        self.assertEqual(result.pk, cms_redirect.pk)
+
     def test_get_cms_redirect_does_not_exist(self):
         """Should return None."""
         result = self.middleware.get_cms_redirect((['/cows/come/home/']))
@@ -175,3 +219,181 @@ class RedirectMiddlewareTest(TestCase):
         request = self.factory.get('/page/elsewhere/?cow=bark&a=b')
         result = self.middleware.process_exception(request, http.Http404())
         self.assertEqual(result['Location'], '/new/?cow=moo&cow=bark&a=b')
+
+    def test_process_exception_matches_query_parameters(self):
+        """Should pick the redirect matching the query parameters."""
+        CMSRedirect.objects.create(
+            site_id=1,
+            old_path='/index.php?page=1',
+            new_path='/one/'
+        )
+        CMSRedirect.objects.create(
+            site_id=1,
+            old_path='/index.php?page=2',
+            new_path='/two/'
+        )
+        request = self.factory.get('/index.php?page=2')
+        result = self.middleware.process_exception(request, http.Http404())
+        self.assertEqual(result['Location'], '/two/?page=2')
+
+    def test_process_exception_query_parameters_any_order(self):
+        """Should match parameters whatever order they are given in."""
+        CMSRedirect.objects.create(
+            site_id=1,
+            old_path='/index.php?page=1&lang=de',
+            new_path='/de/one/',
+            query_handling=QUERY_DROP
+        )
+        request = self.factory.get('/index.php?utm=x&lang=de&page=1')
+        result = self.middleware.process_exception(request, http.Http404())
+        self.assertEqual(result['Location'], '/de/one/')
+
+    def test_process_exception_query_parameters_fall_back_to_path(self):
+        """Should use the plain path redirect when no parameters match."""
+        CMSRedirect.objects.create(
+            site_id=1,
+            old_path='/index.php',
+            new_path='/home/',
+            query_handling=QUERY_DROP
+        )
+        CMSRedirect.objects.create(
+            site_id=1,
+            old_path='/index.php?page=1',
+            new_path='/one/'
+        )
+        request = self.factory.get('/index.php?page=3')
+        result = self.middleware.process_exception(request, http.Http404())
+        self.assertEqual(result['Location'], '/home/')
+
+    def test_process_exception_query_parameters_no_match(self):
+        """Should not redirect when the parameters do not match."""
+        CMSRedirect.objects.create(
+            site_id=1,
+            old_path='/index.php?page=1',
+            new_path='/one/'
+        )
+        request = self.factory.get('/index.php')
+        result = self.middleware.process_exception(request, http.Http404())
+        self.assertIsNone(result)
+
+    @override_settings(REDIRECT_INDEX_SYNC_INTERVAL=0)
+    def test_process_exception_reloads_changed_redirects(self):
+        """Should see redirects saved after the index was loaded."""
+        request = self.factory.get('/page/elsewhere/')
+        self.assertIsNone(
+            self.middleware.process_exception(request, http.Http404()))
+        CMSRedirect.objects.create(
+            site_id=1,
+            old_path='/page/elsewhere/',
+            new_path='/something/new/'
+        )
+        result = self.middleware.process_exception(request, http.Http404())
+        self.assertEqual(result['Location'], '/something/new/')
+
+    def test_cms_redirect_drop_query(self):
+        """Should not pass the query string on."""
+        cmsredirect = CMSRedirect(
+            old_path='/page/elsewhere/',
+            new_path='/something/new/',
+            query_handling=QUERY_DROP
+        )
+        result = self.middleware.cms_redirect(cmsredirect, 'a=b')
+        self.assertEqual(result['Location'], '/something/new/')
+
+    def test_cms_redirect_unmatched_query(self):
+        """Should only pass on parameters not used by the redirect."""
+        cmsredirect = CMSRedirect(
+            old_path='/index.php?page=1',
+            new_path='/something/new/?cow=moo',
+            query_handling=QUERY_UNMATCHED
+        )
+        result = self.middleware.cms_redirect(
+            cmsredirect, 'page=1&cow=bark&a=b')
+        self.assertEqual(result['Location'], '/something/new/?cow=moo&a=b')
+
+    @override_settings(REDIRECT_IGNORE_LANGUAGE_PREFIX=True,
+                       LANGUAGES=[('en', 'English'), ('de', 'German')])
+    def test_split_language_prefix(self):
+        """Should split known language prefixes off."""
+        self.assertEqual(
+            self.middleware.split_language_prefix('/de/some/path/'),
+            ('de', '/some/path/'))
+        self.assertEqual(
+            self.middleware.split_language_prefix('/fr/some/path/'),
+            (None, '/fr/some/path/'))
+        self.assertEqual(
+            self.middleware.split_language_prefix('/de'), (None, '/de'))
+
+    def test_split_language_prefix_off(self):
+        """Should leave paths alone unless enabled."""
+        self.assertEqual(
+            self.middleware.split_language_prefix('/en/some/path/'),
+            (None, '/en/some/path/'))
+
+    @override_settings(REDIRECT_IGNORE_LANGUAGE_PREFIX=True,
+                       LANGUAGES=[('en', 'English'), ('de', 'German')])
+    def test_process_exception_language_prefix(self):
+        """Should match redirects without the language prefix."""
+        CMSRedirect.objects.create(
+            site_id=1,
+            old_path='/page/elsewhere/',
+            new_path='/something/new/'
+        )
+        request = self.factory.get('/de/page/elsewhere/')
+        result = self.middleware.process_exception(request, http.Http404())
+        self.assertEqual(result['Location'], '/something/new/')
+
+    @override_settings(REDIRECT_IGNORE_LANGUAGE_PREFIX=True,
+                       LANGUAGES=[('en', 'English'), ('de', 'German')])
+    def test_process_exception_language_prefix_exact_first(self):
+        """Should prefer a redirect from the path with its prefix."""
+        CMSRedirect.objects.create(
+            site_id=1,
+            old_path='/de/page/elsewhere/',
+            new_path='/exact/'
+        )
+        CMSRedirect.objects.create(
+            site_id=1,
+            old_path='/page/elsewhere/',
+            new_path='/any/'
+        )
+        request = self.factory.get('/de/page/elsewhere/')
+        result = self.middleware.process_exception(request, http.Http404())
+        self.assertEqual(result['Location'], '/exact/')
+
+    @override_settings(REDIRECT_IGNORE_LANGUAGE_PREFIX=True,
+                       LANGUAGES=[('en', 'English'), ('de', 'German')])
+    def test_process_exception_language_prefix_page(self):
+        """Should redirect to the page in the requested language."""
+        page = create_page(
+            title='A page somewhere',
+            template='template_1.html',
+            language='en',
+            slug='a-page-somewhere'
+        )
+        create_title('de', 'Eine Seite', page, slug='eine-seite')
+        CMSRedirect.objects.create(
+            site_id=1,
+            old_path='/page/elsewhere/',
+            page=page
+        )
+        request = self.factory.get('/de/page/elsewhere/')
+        result = self.middleware.process_exception(request, http.Http404())
+        self.assertEqual(result['Location'], '/de/eine-seite/')
+
+    @override_settings(REDIRECT_RECENT_WRITE_WINDOW=10,
+                       REDIRECT_INDEX_SYNC_INTERVAL=60)
+    def test_get_cms_redirect_recent_write(self):
+        """Should find a redirect just saved in the database."""
+        self.assertIsNone(self.middleware.get_cms_redirect(['/a/']))
+        cms_redirect = CMSRedirect.objects.create(site_id=1, old_path='/a/')
+        result = self.middleware.get_cms_redirect(['/a/'])
+        self.assertEqual(result.pk, cms_redirect.pk)
+
+    @override_settings(REDIRECT_INDEX_SYNC_INTERVAL=60)
+    def test_get_cms_redirect_no_recent_write(self):
+        """Should only use the index without a recent write window."""
+        self.assertIsNone(self.middleware.get_cms_redirect(['/a/']))
+        CMSRedirect.objects.create(site_id=1, old_path='/a/')
+        with self.assertNumQueries(0):
+            self.assertIsNone(self.middleware.get_cms_redirect(['/a/']))
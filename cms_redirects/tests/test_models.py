@@ -0,0 +1,75 @@
+"""Tests for redirect models."""
+import datetime
+
+from cms_redirects.models import CMSRedirect
+from cms_redirects.utils import path_hash
+from django.core.exceptions import ValidationError
+from django.test import TestCase
+from django.utils import timezone
+
+
+class CMSRedirectTest(TestCase):
+    """Tests for the CMSRedirect model."""
+    def test_save_sets_old_path_hash(self):
+        """Should store the hash of the path being redirected."""
+        cms_redirect = CMSRedirect.objects.create(
+            site_id=1, old_path='/some/path/'
+        )
+        self.assertEqual(
+            cms_redirect.old_path_hash, path_hash('/some/path/'))
+
+    def test_save_updates_old_path_hash(self):
+        """Should follow changes to the path."""
+        cms_redirect = CMSRedirect.objects.create(
+            site_id=1, old_path='/some/path/'
+        )
+        cms_redirect.old_path = '/other/path/'
+        cms_redirect.save()
+        self.assertEqual(
+            CMSRedirect.objects.get(pk=cms_redirect.pk).old_path_hash,
+            path_hash('/other/path/'))
+
+    def test_clean_duplicate_path(self):
+        """Should refuse a second redirect from the same path."""
+        CMSRedirect.objects.create(site_id=1, old_path='/some/path/')
+        cms_redirect = CMSRedirect(site_id=1, old_path='/some/path/')
+        self.assertRaises(ValidationError, cms_redirect.clean)
+
+    def test_clean_same_redirect(self):
+        """Should allow a redirect to be saved again."""
+        cms_redirect = CMSRedirect.objects.create(
+            site_id=1, old_path='/some/path/'
+        )
+        cms_redirect.clean()
+
+    def test_path_hash_unicode(self):
+        """Should hash unicode paths as utf-8."""
+        self.assertEqual(
+            path_hash(u'/caf\xe9/'), path_hash(u'/caf\xe9/'.encode('utf-8')))
+
+    def test_path_hash_query_order(self):
+        """Should hash the same query parameters in any order the same."""
+        self.assertEqual(
+            path_hash('/index.php?b=2&a=1'), path_hash('/index.php?a=1&b=2'))
+
+    def test_clean_duplicate_path_query_order(self):
+        """Should treat reordered query parameters as the same path."""
+        CMSRedirect.objects.create(site_id=1, old_path='/a.php?x=1&y=2')
+        cms_redirect = CMSRedirect(site_id=1, old_path='/a.php?y=2&x=1')
+        self.assertRaises(ValidationError, cms_redirect.clean)
+
+    def test_is_active(self):
+        """Should only be active between valid_from and valid_until."""
+        now = timezone.now()
+        hour = datetime.timedelta(hours=1)
+        cms_redirect = CMSRedirect(valid_from=now, valid_until=now + hour)
+        self.assertFalse(cms_redirect.is_active(now - hour))
+        self.assertTrue(cms_redirect.is_active(now))
+        self.assertFalse(cms_redirect.is_active(now + hour))
+
+    def test_clean_ends_before_start(self):
+        """Should refuse a schedule ending before it starts."""
+        now = timezone.now()
+        cms_redirect = CMSRedirect(
+            site_id=1, old_path='/a/', valid_from=now, valid_until=now)
+        self.assertRaises(ValidationError, cms_redirect.clean)
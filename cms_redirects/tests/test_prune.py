@@ -0,0 +1,147 @@
+"""Tests for pruning redirects."""
+import csv
+import datetime
+import tempfile
+
+from cms.api import create_page
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from cms_redirects import index
+from cms_redirects.checks import RedirectChecker
+from cms_redirects.models import CMSRedirect, CMSRedirectTombstone
+
+
+class PruneRedirectsTest(TestCase):
+    """Tests for the prune_redirects command."""
+    def setUp(self):
+        """Clear the indexes used by the shadowed check."""
+        index.clear()
+
+    def prune(self, **options):
+        """Prune with small batches, returning the paths left."""
+        options.setdefault('batch_size', 2)
+        call_command('prune_redirects', sleep=0, verbosity=0, **options)
+        return sorted(CMSRedirect.objects.values_list('old_path', flat=True))
+
+    def test_nothing_chosen(self):
+        """Should refuse to run without criteria."""
+        self.assertRaises(CommandError, call_command, 'prune_redirects')
+
+    def test_missing_target(self):
+        """Should delete redirects to unpublished pages and to paths on the
+        site that are not found."""
+        published = create_page('Here', 'template_1.html', 'en',
+                                published=True)
+        unpublished = create_page('Gone', 'template_1.html', 'en')
+        CMSRedirect.objects.create(site_id=1, old_path='/a/', page=published)
+        CMSRedirect.objects.create(site_id=1, old_path='/b/',
+                                   page=unpublished)
+        CMSRedirect.objects.create(site_id=1, old_path='/c/',
+                                   new_path=published.get_absolute_url())
+        CMSRedirect.objects.create(site_id=1, old_path='/d/',
+                                   new_path='/en/nowhere/')
+        CMSRedirect.objects.create(site_id=1, old_path='/e/',
+                                   new_path='http://example.org/nowhere/')
+        CMSRedirect.objects.create(site_id=1, old_path='/f/')
+        self.assertEqual(self.prune(missing_target=True),
+                         ['/a/', '/c/', '/e/', '/f/'])
+
+    def test_older_than(self):
+        """Should delete redirects not changed in a while."""
+        for path in ('/a/', '/b/', '/c/'):
+            CMSRedirect.objects.create(site_id=1, old_path=path)
+        CMSRedirect.objects.filter(old_path__in=['/a/', '/c/']).update(
+            updated_at=timezone.now() - datetime.timedelta(10))
+        self.assertEqual(self.prune(older_than=5), ['/b/'])
+
+    def test_expired(self):
+        """Should delete redirects whose schedule has ended."""
+        CMSRedirect.objects.create(
+            site_id=1, old_path='/a/',
+            valid_until=timezone.now() - datetime.timedelta(1))
+        CMSRedirect.objects.create(site_id=1, old_path='/b/')
+        self.assertEqual(self.prune(expired=True), ['/b/'])
+
+    @override_settings(APPEND_SLASH=True)
+    def test_duplicates(self):
+        """Should delete redirects doing the same as the one without a
+        trailing slash."""
+        CMSRedirect.objects.create(site_id=1, old_path='/a', new_path='/x/')
+        CMSRedirect.objects.create(site_id=1, old_path='/a/', new_path='/x/')
+        CMSRedirect.objects.create(site_id=1, old_path='/b', new_path='/x/')
+        CMSRedirect.objects.create(site_id=1, old_path='/b/', new_path='/y/')
+        CMSRedirect.objects.create(site_id=1, old_path='/c/', new_path='/x/')
+        self.assertEqual(self.prune(duplicates=True),
+                         ['/a', '/b', '/b/', '/c/'])
+
+    def test_shadowed(self):
+        """Should delete redirects from paths that serve content."""
+        page = create_page('Here', 'template_1.html', 'en', slug='here',
+                           published=True)
+        CMSRedirect.objects.create(site_id=1, old_path=page.get_absolute_url(),
+                                   new_path='/x/')
+        CMSRedirect.objects.create(site_id=1, old_path='/en/nothing/',
+                                   new_path='/x/')
+        self.assertEqual(self.prune(shadowed=True), ['/en/nothing/'])
+
+    def test_shadowed_error(self):
+        """Should keep redirects whose path could not be requested."""
+        CMSRedirect.objects.create(site_id=1, old_path='/en/broken/',
+                                   new_path='/x/')
+        CMSRedirect.objects.create(site_id=1, old_path='/en/nothing/',
+                                   new_path='/x/')
+        is_shadowed = RedirectChecker.is_shadowed
+
+        def fail(checker, old_path):
+            if old_path == '/en/broken/':
+                raise ValueError(old_path)
+            return True
+
+        RedirectChecker.is_shadowed = fail
+        try:
+            self.assertEqual(self.prune(shadowed=True), ['/en/broken/'])
+        finally:
+            RedirectChecker.is_shadowed = is_shadowed
+
+    def test_dry_run_backup(self):
+        """Should only back up what would be deleted."""
+        page = create_page('Gone', 'template_1.html', 'en', slug='gone')
+        CMSRedirect.objects.create(site_id=1, old_path='/a/', page=page)
+        CMSRedirect.objects.create(
+            site_id=1, old_path='/b/',
+            valid_until=timezone.now() - datetime.timedelta(1))
+        backup = tempfile.NamedTemporaryFile()
+        self.assertEqual(self.prune(missing_target=True, expired=True,
+                                    dry_run=True, backup=backup.name),
+                         ['/a/', '/b/'])
+        self.assertEqual(list(csv.reader(open(backup.name))), [
+            ['Old Url', 'New Url', 'Response Code'],
+            ['/a/', page.get_absolute_url(), '301'],
+            ['/b/', '', '410'],
+        ])
+
+    def test_backup_replays(self):
+        """Should write a backup that import_redirect_csv can read."""
+        CMSRedirect.objects.create(
+            site_id=1, old_path='/a/', new_path='/x/', response_code='302',
+            valid_until=timezone.now() - datetime.timedelta(1))
+        backup = tempfile.NamedTemporaryFile()
+        self.assertEqual(self.prune(expired=True, backup=backup.name), [])
+        call_command('import_redirect_csv', backup.name)
+        redirect = CMSRedirect.objects.get()
+        self.assertEqual((redirect.old_path, redirect.new_path,
+                          redirect.response_code), ('/a/', '/x/', '302'))
+
+    def test_tombstones(self):
+        """Should delete old tombstones."""
+        CMSRedirectTombstone.objects.create(
+            site_id=1, redirect_id=1,
+            deleted_at=timezone.now() - datetime.timedelta(10))
+        CMSRedirectTombstone.objects.create(site_id=1, redirect_id=2)
+        self.prune(tombstones=5)
+        self.assertEqual(list(CMSRedirectTombstone.objects.values_list(
+            'redirect_id', flat=True)), [2])
@@ -0,0 +1,91 @@
+"""Tests for replaying access logs."""
+import sys
+import tempfile
+from StringIO import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+from cms_redirects import index, replay
+from cms_redirects.models import CMSRedirect
+
+
+LOG = '''\
+1.2.3.4 - - [10/Oct/2013:13:55:36 +0000] "GET /old/ HTTP/1.1" 404 2326 "-" "Mozilla/5.0"
+1.2.3.4 - - [10/Oct/2013:13:55:37 +0000] "GET /gone/?x=1 HTTP/1.1" 404 12 "-" "Mozilla/5.0"
+1.2.3.4 - - [10/Oct/2013:13:55:38 +0000] "GET /junk.php HTTP/1.1" 404 12 "-" "bot"
+1.2.3.4 - - [10/Oct/2013:13:55:39 +0000] "POST /old/ HTTP/1.1" 404 12 "-" "bot"
+1.2.3.4 - - [10/Oct/2013:13:55:40 +0000] "GET /page/ HTTP/1.1" 200 512
+not a log line
+'''
+
+
+class ReplayTest(TestCase):
+    """Tests for replaying access logs."""
+    def setUp(self):
+        """Make a couple of redirects."""
+        index.clear()
+        CMSRedirect.objects.create(site_id=1, old_path='/old/',
+                                   new_path='/new/')
+        CMSRedirect.objects.create(site_id=1, old_path='/gone/')
+
+    def test_parse_log(self):
+        """Should yield the paths of GET and HEAD requests."""
+        self.assertEqual(list(replay.parse_log(StringIO(LOG))),
+                         ['/old/', '/gone/?x=1', '/junk.php', '/page/'])
+        self.assertEqual(list(replay.parse_log(StringIO(LOG), set([200]))),
+                         ['/page/'])
+
+    def test_run(self):
+        """Should count hits, misses, response codes and queries."""
+        index.get_index(1)
+        stats = replay.run(replay.parse_log(StringIO(LOG), set([404])))
+        self.assertEqual(len(stats), 3)
+        self.assertEqual((stats.hits, stats.misses, stats.errors), (2, 1, 0))
+        self.assertEqual(stats.codes, {301: 1, 410: 1})
+        self.assertEqual(stats.queries, 0)
+        self.assertEqual(sum(stats.histogram()), 3)
+
+    def test_run_threads(self):
+        """Should add up what each thread replayed."""
+        index.get_index(1)
+        stats = replay.run(replay.parse_log(StringIO(LOG * 3), set([404])),
+                           threads=4)
+        self.assertEqual(len(stats), 9)
+        self.assertEqual((stats.hits, stats.misses, stats.errors), (6, 3, 0))
+        self.assertEqual(stats.codes, {301: 3, 410: 3})
+
+    def test_run_processes(self):
+        """Should add up what each forked process replayed."""
+        index.get_index(1)
+        stats = replay.run(replay.parse_log(StringIO(LOG * 3), set([404])),
+                           processes=2)
+        self.assertEqual(len(stats), 9)
+        self.assertEqual((stats.hits, stats.misses, stats.errors), (6, 3, 0))
+        self.assertEqual(stats.codes, {301: 3, 410: 3})
+
+    def test_command_threads_and_processes(self):
+        """Should refuse to combine threads and processes."""
+        log = tempfile.NamedTemporaryFile()
+        log.write(LOG)
+        log.flush()
+        self.assertRaises(CommandError, call_command, 'replay_access_log',
+                          log.name, threads=2, processes=2)
+
+    def test_command(self):
+        """Should print a report."""
+        log = tempfile.NamedTemporaryFile()
+        log.write(LOG)
+        log.flush()
+        output = tempfile.TemporaryFile()
+        self.addCleanup(output.close)
+        stdout, sys.stdout = sys.stdout, output
+        try:
+            call_command('replay_access_log', log.name, statuses='404')
+        finally:
+            sys.stdout = stdout
+        output.seek(0)
+        report = output.read()
+        self.assertIn('Requests: 3 in', report)
+        self.assertIn('Redirected: 2, not found: 1, errors: 0', report)
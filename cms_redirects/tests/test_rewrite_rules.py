@@ -0,0 +1,149 @@
+"""Tests for importing nginx and Apache rewrite rules."""
+import tempfile
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+from cms_redirects import rewrite_rules
+from cms_redirects.models import CMSRedirect, QUERY_DROP, QUERY_KEEP
+
+
+NGINX = '''
+server {
+    rewrite ^/old\.html$ /new/ permanent;
+    rewrite "^/news/(\d+)$" /articles/$1 permanent;
+    rewrite ^/internal$ /other last;
+    map $uri $moved {
+        default "";
+        /mapped/ /target/;
+        ~^/regex/.*$ /x/;
+    }
+    location = /exact {
+        return 301 https://example.org$request_uri;
+    }
+    location /prefix/ {
+        return 302 /elsewhere/;
+    }
+    location = /gone {
+        return 410;
+    }
+    location = /campaign {
+        if ($arg_utm) {
+            return 302 /landing/;
+        }
+    }
+}
+'''
+
+APACHE = '''
+RewriteEngine On
+Redirect 301 /folder http://example.org/folder
+RedirectMatch permanent ^/match\.php$ /matched/
+RewriteRule ^/?rule/?$ /ruled/? [R=301,L]
+RewriteCond %{HTTP_HOST} ^www\.
+RewriteRule ^/conditional$ /x/ [R,L]
+RewriteRule ^/proxied$ /backend/ [P]
+RewriteRule ^/removed$ - [G]
+RedirectMatch ^/long/ \\
+    /continued/
+'''
+
+
+def rules(text, **kwargs):
+    """Return the rules in text by old path, or by line if unsupported."""
+    return dict((rule.old_path or rule.line, rule) for rule in
+                rewrite_rules.parse(text.splitlines(), **kwargs))
+
+
+class RewriteRulesTest(TestCase):
+    """Tests for reading rewrite rules."""
+    def test_literal_path(self):
+        """Should only find paths in literal regular expressions."""
+        self.assertEqual(rewrite_rules.literal_path(r'^/a\.html$'), '/a.html')
+        self.assertEqual(rewrite_rules.literal_path('^/?a/b/?$'), '/a/b')
+        self.assertEqual(rewrite_rules.literal_path('^/a/.*$'), None)
+        self.assertEqual(rewrite_rules.literal_path(r'^/a\d$'), None)
+        self.assertEqual(rewrite_rules.literal_path('^/a'), None)
+
+    def test_guess_format(self):
+        """Should tell Apache from nginx configuration."""
+        self.assertEqual(rewrite_rules.guess_format(NGINX.splitlines()),
+                         'nginx')
+        self.assertEqual(rewrite_rules.guess_format(APACHE.splitlines()),
+                         'apache')
+
+    def test_guess_format_htaccess(self):
+        """Should tell an .htaccess file by any Apache directive in it."""
+        htaccess = ('Options -Indexes\n'
+                    'ErrorDocument 404 /404.html\n'
+                    'Redirect 301 /a /b\n')
+        self.assertEqual(rewrite_rules.guess_format(htaccess.splitlines()),
+                         'apache')
+        self.assertEqual(rewrite_rules.guess_format(
+            ['MyDirective on', 'Redirect 301 /a /b']), 'apache')
+        self.assertEqual(rewrite_rules.guess_format(
+            ['Unknown on', 'Other off']), 'apache')
+
+    def test_nginx(self):
+        """Should read the rules matching one path."""
+        found = rules(NGINX)
+        self.assertEqual(found['/old.html'].new_path, '/new/')
+        self.assertEqual(found['/old.html'].response_code, '301')
+        self.assertEqual(found['/mapped/'].new_path, '/target/')
+        self.assertEqual(found['/mapped/'].kind, rewrite_rules.EXACT)
+        self.assertEqual(found['/exact'].new_path, 'https://example.org/exact')
+        self.assertEqual(found['/gone'].new_path, '')
+        self.assertEqual(found['/gone'].response_code, '410')
+        self.assertEqual(len([r for r in found.values() if r.problem]), 5)
+
+    def test_nginx_prefix_as_exact(self):
+        """Should import prefix locations as exact ones if asked to."""
+        found = rules(NGINX, prefix_as_exact=True)
+        self.assertEqual(found['/prefix/'].new_path, '/elsewhere/')
+        self.assertEqual(found['/prefix/'].response_code, '302')
+        self.assertEqual(found['/prefix/'].kind, rewrite_rules.PREFIX)
+
+    def test_apache(self):
+        """Should read the rules matching one path."""
+        found = rules(APACHE)
+        self.assertEqual(found['/match.php'].new_path, '/matched/')
+        self.assertEqual(found['/match.php'].response_code, '301')
+        self.assertEqual(found['/rule'].new_path, '/ruled/')
+        self.assertEqual(found['/rule'].query_handling, QUERY_DROP)
+        self.assertEqual(found['/removed'].response_code, '410')
+        self.assertEqual(found[10].problem.split(':')[0],
+                         'pattern is not a literal path')
+        self.assertEqual(len([r for r in found.values() if r.problem]), 4)
+
+    def test_command(self):
+        """Should create the redirects that can be imported, once."""
+        config = tempfile.NamedTemporaryFile()
+        config.write(APACHE)
+        config.flush()
+        call_command('import_redirect_rules', config.name, verbosity=0)
+        call_command('import_redirect_rules', config.name, verbosity=0)
+        redirects = CMSRedirect.objects.order_by('old_path')
+        self.assertEqual(
+            [(r.old_path, r.new_path, r.query_handling) for r in redirects],
+            [('/match.php', '/matched/', QUERY_KEEP),
+             ('/removed', '', QUERY_KEEP),
+             ('/rule', '/ruled/', QUERY_DROP)])
+
+    def test_command_map_response_code(self):
+        """Should refuse map response codes other than 301 and 302."""
+        config = tempfile.NamedTemporaryFile()
+        config.write(NGINX)
+        config.flush()
+        self.assertRaises(CommandError, call_command, 'import_redirect_rules',
+                          config.name, map_response_code='399', verbosity=0)
+        self.assertEqual(CMSRedirect.objects.count(), 0)
+
+    def test_command_no_rules(self):
+        """Should fail if a file has no rules at all in the format."""
+        config = tempfile.NamedTemporaryFile()
+        config.write(APACHE)
+        config.flush()
+        self.assertRaises(CommandError, call_command, 'import_redirect_rules',
+                          config.name, format='nginx', verbosity=0)
+        self.assertEqual(CMSRedirect.objects.count(), 0)
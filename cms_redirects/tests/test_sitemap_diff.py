@@ -0,0 +1,125 @@
+"""Tests for matching sitemaps and loading the redirects."""
+import csv
+import tempfile
+from StringIO import StringIO
+
+from django.contrib.sites.models import Site
+from django.core.management import call_command
+from django.test import TestCase
+
+from cms_redirects import sitemap_diff
+from cms_redirects.bulk import load_redirects
+from cms_redirects.models import CMSRedirect
+from cms_redirects.utils import path_hash
+
+
+SITEMAP = '''<?xml version="1.0" encoding="UTF-8"?>
+<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+%s
+</urlset>'''
+
+
+def make_sitemap(*paths):
+    """Return a sitemap file of paths on example.com."""
+    return StringIO(SITEMAP % '\n'.join(
+        '<url><loc>http://example.com%s</loc></url>' % p for p in paths))
+
+
+class SitemapMatcherTest(TestCase):
+    """Tests for matching the urls of sitemaps."""
+    def setUp(self):
+        """Make a matcher of a new sitemap."""
+        self.matcher = sitemap_diff.SitemapMatcher()
+        for path in sitemap_diff.iter_sitemap(make_sitemap(
+                '/', '/about/team/', '/news/summer-fair-2013/',
+                '/blog/team/', '/products/blue-widgets/')):
+            self.matcher.add(path)
+
+    def test_iter_sitemap(self):
+        """Should yield the paths of the urls."""
+        paths = list(sitemap_diff.iter_sitemap(
+            make_sitemap('/a/', '/b/?c=d')))
+        self.assertEqual(paths, ['/a/', '/b/?c=d'])
+
+    def test_iter_sitemap_index(self):
+        """Should not take the sitemaps of a sitemap index for pages."""
+        paths = list(sitemap_diff.iter_sitemap(StringIO(
+            '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+            '<sitemap><loc>http://example.com/sitemap-1.xml</loc>'
+            '<lastmod>2013-01-01</lastmod></sitemap>'
+            '</sitemapindex>')))
+        self.assertEqual(paths, [])
+
+    def test_kept(self):
+        """Should not match urls that are still there."""
+        self.assertEqual(self.matcher.match('/about/team/'), None)
+
+    def test_slug(self):
+        """Should match urls by slug."""
+        self.assertEqual(self.matcher.match('/products/widgets/blue-widgets.html'),
+                         ('/products/blue-widgets/', sitemap_diff.EXACT))
+
+    def test_slug_closest(self):
+        """Should pick the url most like the old one among equal slugs."""
+        self.assertEqual(self.matcher.match('/about-us/team/'),
+                         ('/about/team/', sitemap_diff.EXACT))
+
+    def test_fuzzy(self):
+        """Should match similar slugs."""
+        self.assertEqual(self.matcher.match('/events/summer-fair/'),
+                         ('/news/summer-fair-2013/', sitemap_diff.FUZZY))
+
+    def test_unmatched(self):
+        """Should not match dissimilar slugs."""
+        self.assertEqual(self.matcher.match('/contact/'), None)
+
+
+class LoadRedirectsTest(TestCase):
+    """Tests for loading redirects in bulk."""
+    def test_load_redirects(self):
+        """Should create new redirects with their hash and skip others."""
+        site = Site.objects.get_current()
+        CMSRedirect.objects.create(site=site, old_path='/a/')
+        created, skipped = load_redirects(site, [
+            CMSRedirect(old_path='/a/', new_path='/x/'),
+            CMSRedirect(old_path='/b/?d=e&c=f', new_path='/y/'),
+            CMSRedirect(old_path='/b/?c=f&d=e', new_path='/z/'),
+            CMSRedirect(old_path='/c/', new_path='/z/'),
+        ], chunk_size=2)
+        self.assertEqual((created, skipped), (2, 2))
+        redirect = CMSRedirect.objects.get(old_path='/b/?d=e&c=f')
+        self.assertEqual(redirect.old_path_hash, path_hash('/b/?c=f&d=e'))
+        self.assertEqual(redirect.new_path, '/y/')
+        self.assertEqual(CMSRedirect.objects.get(old_path='/a/').new_path, '')
+
+
+class DiffSitemapsCommandTest(TestCase):
+    """Tests for the diff_sitemaps command."""
+    def setUp(self):
+        """Write an old and a new sitemap."""
+        self.old = tempfile.NamedTemporaryFile()
+        self.old.write(make_sitemap('/', '/old/widgets.html', '/gone/').read())
+        self.old.flush()
+        self.new = tempfile.NamedTemporaryFile()
+        self.new.write(make_sitemap('/', '/shop/widgets/').read())
+        self.new.flush()
+
+    def test_csv(self):
+        """Should write a csv file import_redirect_csv can read."""
+        output = tempfile.NamedTemporaryFile()
+        call_command('diff_sitemaps', self.old.name, self.new.name,
+                     output=output.name, gone=True, verbosity=0)
+        rows = list(csv.reader(open(output.name)))
+        self.assertEqual(rows, [
+            ['Old Url', 'New Url', 'Response Code'],
+            ['/old/widgets.html', '/shop/widgets/', '301'],
+            ['/gone/', '', '410'],
+        ])
+
+    def test_load(self):
+        """Should create the redirects."""
+        call_command('diff_sitemaps', self.old.name, self.new.name,
+                     load=True, verbosity=0)
+        redirect = CMSRedirect.objects.get()
+        self.assertEqual(redirect.old_path, '/old/widgets.html')
+        self.assertEqual(redirect.new_path, '/shop/widgets/')
@@ -0,0 +1,142 @@
+"""Tests for the JSON views."""
+import json
+
+from cms.api import create_page
+from django.contrib.auth.models import User
+from django.contrib.sites.models import Site
+from django.test import RequestFactory, TestCase
+from django.test.utils import override_settings
+
+from cms_redirects import views
+from cms_redirects.models import (
+    CMSRedirect, CMSRedirectTombstone, QUERY_DROP)
+
+
+class RedirectViewsTest(TestCase):
+    """Tests for the JSON views."""
+    def setUp(self):
+        """Make requests as someone allowed to change redirects."""
+        self.factory = RequestFactory()
+        self.user = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'admin')
+        Site.objects.get_current()
+
+    def post(self, view, data):
+        """Post data as JSON, returning the status and decoded response."""
+        request = self.factory.post('/', json.dumps(data),
+                                    content_type='application/json')
+        request.user = self.user
+        response = view(request)
+        return response.status_code, json.loads(response.content)
+
+    def get(self, view, data):
+        """Get a view, returning the decoded response."""
+        request = self.factory.get('/', data)
+        request.user = self.user
+        return json.loads(view(request).content)
+
+    def test_permission(self):
+        """Should refuse users without permission."""
+        self.user = User.objects.create_user('user', 'user@example.com')
+        status, data = self.post(views.lookup, {'paths': []})
+        self.assertEqual(status, 403)
+
+    def test_upsert(self):
+        """Should create new redirects and update existing ones."""
+        page = create_page('Here', 'template_1.html', 'en')
+        a = CMSRedirect.objects.create(site_id=1, old_path='/a/',
+                                       new_path='/x/', response_code='302')
+        CMSRedirect.objects.create(site_id=1, old_path='/b/', new_path='/x/')
+        CMSRedirect.objects.create(site_id=1, old_path='/c/', new_path='/x/')
+        with self.assertNumQueries(7):
+            status, data = self.post(views.upsert, {'redirects': [
+                {'old_path': '/a/', 'new_path': '/y/'},
+                {'old_path': '/b/', 'new_path': '/z/'},
+                {'old_path': '/c/', 'new_path': '/x/'},
+                {'old_path': '/d/?p=1', 'page': page.pk,
+                 'query_handling': QUERY_DROP},
+                {'old_path': '/e/', 'valid_until': '2030-01-01T00:00:00'},
+            ]})
+        self.assertEqual(status, 200)
+        self.assertEqual(data, {'created': 2, 'updated': 2, 'unchanged': 1})
+        redirects = dict((r.old_path, r) for r in CMSRedirect.objects.all())
+        self.assertEqual(redirects['/a/'].pk, a.pk)
+        self.assertEqual(redirects['/a/'].new_path, '/y/')
+        self.assertEqual(redirects['/a/'].response_code, '302')
+        self.assertTrue(redirects['/a/'].updated_at > a.updated_at)
+        self.assertEqual(redirects['/b/'].new_path, '/z/')
+        self.assertEqual(redirects['/d/?p=1'].page_id, page.pk)
+        self.assertEqual(redirects['/d/?p=1'].query_handling, QUERY_DROP)
+        self.assertEqual(redirects['/e/'].valid_until.year, 2030)
+        self.assertFalse(CMSRedirectTombstone.objects.exists())
+
+    def test_upsert_invalid(self):
+        """Should change nothing if any redirect is invalid."""
+        status, data = self.post(views.upsert, {'redirects': [
+            {'old_path': '/a/', 'new_path': '/y/'},
+            {'old_path': '/b/', 'response_code': '303'},
+            {'old_path': '/c/', 'page': 12345},
+        ]})
+        self.assertEqual(status, 400)
+        self.assertEqual(len(data['errors']), 2)
+        self.assertFalse(CMSRedirect.objects.exists())
+
+    def test_upsert_schedule(self):
+        """Should refuse redirects ending before they start, taking the
+        fields left out from the existing redirect."""
+        CMSRedirect.objects.create(
+            site_id=1, old_path='/a/', new_path='/x/',
+            valid_from=views.get_datetime('2030-01-01T00:00:00'))
+        status, data = self.post(views.upsert, {'redirects': [
+            {'old_path': '/b/', 'valid_from': '2030-01-01T00:00:00',
+             'valid_until': '2029-01-01T00:00:00'},
+        ]})
+        self.assertEqual(status, 400)
+        status, data = self.post(views.upsert, {'redirects': [
+            {'old_path': '/c/', 'new_path': '/y/'},
+            {'old_path': '/a/', 'valid_until': '2029-01-01T00:00:00'},
+        ]})
+        self.assertEqual(status, 400)
+        self.assertEqual(data['errors'],
+                         ['/a/: A redirect has to end after it starts.'])
+        self.assertEqual(
+            list(CMSRedirect.objects.values_list('old_path', 'valid_until')),
+            [('/a/', None)])
+
+    @override_settings(REDIRECT_API_MAX_BATCH=2)
+    def test_upsert_too_many(self):
+        """Should refuse more redirects than the maximum batch size."""
+        status, data = self.post(views.upsert, {'redirects': [
+            {'old_path': '/a/'}, {'old_path': '/b/'}, {'old_path': '/c/'},
+        ]})
+        self.assertEqual(status, 400)
+
+    def test_lookup(self):
+        """Should look up many paths with one query."""
+        redirect = CMSRedirect.objects.create(
+            site_id=1, old_path='/a/?p=1&q=2', new_path='/x/')
+        with self.assertNumQueries(1):
+            status, data = self.post(views.lookup, {
+                'paths': ['/a/?q=2&p=1', '/b/'],
+            })
+        self.assertEqual(status, 200)
+        self.assertEqual(data['redirects']['/a/?q=2&p=1']['id'], redirect.pk)
+        self.assertEqual(data['redirects']['/b/'], None)
+
+    def test_list(self):
+        """Should page through the redirects by id."""
+        for path in ('/a/', '/b/', '/c/'):
+            CMSRedirect.objects.create(site_id=1, old_path=path)
+        data = self.get(views.redirect_list, {'limit': 2})
+        self.assertEqual([r['old_path'] for r in data['redirects']],
+                         ['/a/', '/b/'])
+        data = self.get(views.redirect_list,
+                        {'limit': 2, 'after': data['next']})
+        self.assertEqual([r['old_path'] for r in data['redirects']], ['/c/'])
+        self.assertEqual(data['next'], None)
+
+    def test_list_post(self):
+        """Should only list redirects on GET."""
+        request = self.factory.post('/')
+        request.user = self.user
+        self.assertEqual(views.redirect_list(request).status_code, 405)
@@ -0,0 +1,7 @@
+from django.conf.urls import patterns, url
+
+urlpatterns = patterns('cms_redirects.views',
+    url(r'^$', 'redirect_list', name='cms_redirects_list'),
+    url(r'^upsert/$', 'upsert', name='cms_redirects_upsert'),
+    url(r'^lookup/$', 'lookup', name='cms_redirects_lookup'),
+)
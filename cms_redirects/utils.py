@@ -0,0 +1,86 @@
+"""Helpers for working with redirect paths."""
+import hashlib
+import struct
+from urllib import urlencode
+from urlparse import parse_qsl
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+
+
+RECENT_WRITE_KEY = 'cms_redirects:recent_write:%s'
+
+
+def to_bytes(value):
+    """Return value as a utf-8 encoded string."""
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return value
+
+
+def parse_query(query):
+    """Return a dict of the parameters in a query string.
+
+    If a parameter is repeated the last value wins.
+    """
+    return dict(parse_qsl(to_bytes(query), keep_blank_values=True))
+
+
+def split_path(path):
+    """Split a redirect path into its path and query parameters.
+
+    The parameters are returned as a tuple of ``(name, value)`` pairs
+    sorted by name, so the same parameters in a different order give the
+    same result.
+    """
+    path, _, query = to_bytes(path).partition('?')
+    return path, tuple(sorted(parse_query(query).items()))
+
+
+def canonical_path(path):
+    """Return path with its query parameters in a canonical order."""
+    path, params = split_path(path)
+    if params:
+        return '%s?%s' % (path, urlencode(params))
+    return path
+
+
+def path_hash(path):
+    """Return a signed 64-bit hash of a redirect path.
+
+    This is the fixed width value stored in ``CMSRedirect.old_path_hash``
+    and used to look redirects up by equality. The path is canonicalized
+    first. Different paths can share a hash, so the full path of anything
+    found still has to be compared.
+    """
+    digest = hashlib.sha1(canonical_path(path)).digest()
+    return struct.unpack('>q', digest[:8])[0]
+
+
+def mark_recent_write(site_id):
+    """Note in the cache that the redirects of a site were just changed.
+
+    Lasts ``REDIRECT_RECENT_WRITE_WINDOW`` seconds, see ``recently_written``.
+    """
+    window = getattr(settings, 'REDIRECT_RECENT_WRITE_WINDOW', 0)
+    if window:
+        cache.set(RECENT_WRITE_KEY % site_id, True, window)
+
+
+def recently_written(site_id):
+    """Returns whether the redirects of a site were just changed.
+
+    In that case redirects missing from the indexes or read replicas may
+    be worth looking for in the primary database.
+    """
+    if not getattr(settings, 'REDIRECT_RECENT_WRITE_WINDOW', 0):
+        return False
+    return bool(cache.get(RECENT_WRITE_KEY % site_id))
+
+
+def close_connections():
+    """Close the database connections, so threads and forked processes
+    do not share them."""
+    for conn in connections.all():
+        conn.close()
@@ -0,0 +1,234 @@
+"""JSON views for creating and looking up redirects in bulk."""
+import json
+from functools import wraps
+
+from cms.models import Page
+from django.conf import settings
+from django.contrib.sites.models import Site
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.views.decorators.http import require_GET, require_POST
+
+from cms_redirects.bulk import upsert_redirects
+from cms_redirects.index import database_redirects
+from cms_redirects.models import (
+    CMSRedirect, QUERY_HANDLING_CHOICES, RESPONSE_CODES)
+from cms_redirects.utils import canonical_path
+
+
+API_FIELDS = (
+    'id',
+    'old_path',
+    'new_path',
+    'page',
+    'response_code',
+    'query_handling',
+    'valid_from',
+    'valid_until',
+    'updated_at',
+)
+
+
+class BadRequest(Exception):
+    """Raised for requests that can not be answered."""
+
+
+def get_max_batch():
+    """Return the most redirects or paths a request can carry."""
+    return getattr(settings, 'REDIRECT_API_MAX_BATCH', 1000)
+
+
+def json_response(data, status=200):
+    """Return data as a JSON response."""
+    return HttpResponse(json.dumps(data, cls=DjangoJSONEncoder),
+                        status=status, content_type='application/json')
+
+
+def api_view(*permissions):
+    """Answer with JSON errors, checking the user has the permissions."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not request.user.has_perms(permissions):
+                return json_response({'errors': ['Permission denied']}, 403)
+            try:
+                return view(request, *args, **kwargs)
+            except BadRequest, error:
+                return json_response({'errors': error.args[0]}, 400)
+        return wrapper
+    return decorator
+
+
+def read_json(request):
+    """Return the JSON object in the body of a request."""
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        raise BadRequest(['Request body is not JSON'])
+    if not isinstance(data, dict):
+        raise BadRequest(['Request body is not a JSON object'])
+    return data
+
+
+def get_site(domain):
+    """Return the site with a domain, or the current site."""
+    if domain is None:
+        return Site.objects.get_current()
+    try:
+        return Site.objects.get(domain=domain)
+    except Site.DoesNotExist:
+        raise BadRequest(['No site found, invalid domain: %s' % domain])
+
+
+def get_list(data, name):
+    """Return the list of up to the maximum batch size in a request."""
+    items = data.get(name)
+    if not isinstance(items, list):
+        raise BadRequest(['%s should be a list' % name])
+    if len(items) > get_max_batch():
+        raise BadRequest(['At most %s %s at a time' % (get_max_batch(), name)])
+    return items
+
+
+def get_datetime(value):
+    """Return the datetime in an ISO 8601 string."""
+    if value is None:
+        return None
+    parsed = None
+    if isinstance(value, basestring):
+        parsed = parse_datetime(value)
+    if parsed is None:
+        raise ValueError('%r is not a date and time' % (value,))
+    if settings.USE_TZ and timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, timezone.get_default_timezone())
+    if not settings.USE_TZ and timezone.is_aware(parsed):
+        parsed = timezone.make_naive(parsed, timezone.get_default_timezone())
+    return parsed
+
+
+def clean_redirect(item):
+    """Return the field values of a redirect sent in a request.
+
+    Only the fields given are returned, so updates leave the others be.
+    """
+    if not isinstance(item, dict):
+        raise ValueError('should be an object')
+    old_path = item.get('old_path')
+    if not isinstance(old_path, basestring) or not old_path:
+        raise ValueError('old_path is required')
+    fields = {'old_path': old_path}
+    if 'new_path' in item:
+        if not isinstance(item['new_path'], basestring):
+            raise ValueError('new_path should be a string')
+        fields['new_path'] = item['new_path']
+    for name in ('old_path', 'new_path'):
+        if len(fields.get(name, '')) > 2000:
+            raise ValueError('%s is longer than 2000 characters' % name)
+    if 'page' in item:
+        if item['page'] is not None and type(item['page']) not in (int, long):
+            raise ValueError('page should be the id of a page')
+        fields['page_id'] = item['page']
+    if 'response_code' in item:
+        if item['response_code'] not in dict(RESPONSE_CODES):
+            raise ValueError('response_code should be one of %s' %
+                             ', '.join(dict(RESPONSE_CODES)))
+        fields['response_code'] = item['response_code']
+    if 'query_handling' in item:
+        if item['query_handling'] not in dict(QUERY_HANDLING_CHOICES):
+            raise ValueError('query_handling should be one of %s' %
+                             ', '.join(dict(QUERY_HANDLING_CHOICES)))
+        fields['query_handling'] = item['query_handling']
+    for name in ('valid_from', 'valid_until'):
+        if name in item:
+            fields[name] = get_datetime(item[name])
+    if (fields.get('valid_from') and fields.get('valid_until') and
+            fields['valid_until'] <= fields['valid_from']):
+        raise ValueError('valid_until should be after valid_from')
+    return fields
+
+
+@require_POST
+@api_view('cms_redirects.add_cmsredirect', 'cms_redirects.change_cmsredirect')
+def upsert(request):
+    """Create or update the redirects in a request, all or none of them.
+
+    Takes ``{"site": domain, "redirects": [{"old_path": ..., ...}]}``,
+    where the site is optional, and answers with the number of redirects
+    created, updated and unchanged.
+    """
+    data = read_json(request)
+    site = get_site(data.get('site'))
+    redirects = []
+    errors = []
+    for number, item in enumerate(get_list(data, 'redirects')):
+        try:
+            redirects.append(clean_redirect(item))
+        except ValueError, error:
+            errors.append('Redirect %s: %s' % (number, error))
+    page_ids = set(r['page_id'] for r in redirects if r.get('page_id'))
+    if page_ids:
+        missing = page_ids.difference(Page.objects.filter(
+            pk__in=page_ids).values_list('pk', flat=True))
+        errors.extend('No page with id %s' % pk for pk in sorted(missing))
+    if errors:
+        raise BadRequest(errors)
+    try:
+        created, updated, unchanged = upsert_redirects(site, redirects)
+    except ValidationError, error:
+        raise BadRequest(error.messages)
+    return json_response({
+        'created': created,
+        'updated': updated,
+        'unchanged': unchanged,
+    })
+
+
+@require_POST
+@api_view('cms_redirects.change_cmsredirect')
+def lookup(request):
+    """Look up the redirects from many paths with one query.
+
+    Takes ``{"site": domain, "paths": [...]}``, where the site is
+    optional, and answers with the redirect from each path, or null.
+    Paths are compared as stored, with their query parameters in any
+    order.
+    """
+    data = read_json(request)
+    site = get_site(data.get('site'))
+    paths = get_list(data, 'paths')
+    if not all(isinstance(path, basestring) for path in paths):
+        raise BadRequest(['paths should be strings'])
+    found = {}
+    for redirect in database_redirects(site.pk, paths).values(*API_FIELDS):
+        found[canonical_path(redirect['old_path'])] = redirect
+    return json_response({
+        'redirects': dict((path, found.get(canonical_path(path)))
+                          for path in paths),
+    })
+
+
+@require_GET
+@api_view('cms_redirects.change_cmsredirect')
+def redirect_list(request):
+    """List the redirects of a site in order of id, a page at a time.
+
+    Takes the optional ``site``, ``limit`` and ``after`` parameters. Pages
+    are found by id rather than by offset, so deep pages are as quick as
+    the first. The next page starts after the ``next`` id answered.
+    """
+    site = get_site(request.GET.get('site'))
+    try:
+        after = int(request.GET.get('after', 0))
+        limit = int(request.GET.get('limit', 100))
+    except ValueError:
+        raise BadRequest(['after and limit should be numbers'])
+    limit = max(1, min(limit, get_max_batch()))
+    redirects = list(CMSRedirect.objects.filter(
+        site=site, pk__gt=after).order_by('pk').values(*API_FIELDS)[:limit])
+    next_after = None
+    if len(redirects) == limit:
+        next_after = redirects[-1]['id']
+    return json_response({'redirects': redirects, 'next': next_after})
@@ -5,7 +5,11 @@ from django.conf import settings
 
 admin.autodiscover()
 
-urlpatterns = i18n_patterns('',
+urlpatterns = patterns('',
+    url(r'^redirects/', include('cms_redirects.urls')),
+)
+
+urlpatterns += i18n_patterns('',
     url(r'^admin/', include(admin.site.urls)),
     url(r'^', include('cms.urls')),
 )